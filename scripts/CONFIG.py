@@ -1,4 +1,102 @@
 start_year = 1944
 end_year = 2023
 engine = "cfgrib" ## "netcdf4" or "cfgrib"
-file_name = f"era5-monthly-temp.{'nc' if engine == 'netcdf4' else 'grib'}"
\ No newline at end of file
+file_name = f"era5-monthly-temp.{'nc' if engine == 'netcdf4' else 'grib'}"
+
+# The input file is decoded once into this chunked, compressed float32 store (see scripts/ingest-grib.py)
+store_file_name = "era5-monthly-temp-store.nc"
+store_chunks = {"time": 12, "latitude": 181, "longitude": 360}
+
+# Seasons to compute, as the months of each season in each hemisphere, in order. A season that
+# crosses the new year (12, 1, 2) belongs to the year it ends in, so winter 2000 in the north is
+# Dec 1999 - Feb 2000; add "year": "start" to a season to count it in the year it starts in
+# instead. Use "months" in place of "north" and "south" for the same months in both hemispheres.
+# Seasons can overlap, and every season is computed in the same pass over the data.
+seasons = {
+    "summer": {"north": [6, 7, 8], "south": [12, 1, 2]},
+    "winter": {"north": [12, 1, 2], "south": [6, 7, 8]},
+    "spring": {"north": [3, 4, 5], "south": [9, 10, 11]},
+    "autumn": {"north": [9, 10, 11], "south": [3, 4, 5]},
+}
+
+# Number of latitude rows loaded at a time by the grid stages
+band_size = 60
+
+# Also write one seasonal_temps_{year}.nc file per year next to the stacked seasonal cube
+export_yearly_files = False
+
+# Layout of the seasonal temperature files. "maps" stores uncompressed float64 maps, one per year,
+# exactly as the temperatures are computed. "timeseries" stores float32 compressed with zlib and
+# shuffle, in chunks of every year for cube_chunk x cube_chunk cells, so reading the history of one
+# cell only touches one small chunk. float32 rounds the temperatures to about 7 significant digits
+# (around 1e-5 °F), which changes the slopes and records in their last digits.
+# scripts/rechunk-seasons.py converts existing files to the layout set here.
+cube_layout = "maps"
+cube_chunk = 16
+
+# Baseline period of the per-cell monthly climatology that make-anomalies.py measures anomalies
+# against. The climatology is cached in data/output/climatology and only recomputed when the
+# period or the ERA5 store changes.
+climatology_start_year = 1951
+climatology_end_year = 1980
+
+# Run the grid and season stages chunked and lazily with dask, keeping every worker's
+# chunks within memory_limit in total. workers = None uses every core on the machine.
+use_dask = False
+workers = None
+memory_limit = "4GB"
+
+# Or run annual-seasons.py, make-regression-netcdf.py and calculate-percentage.py on a pool of
+# `workers` processes, one band of latitude rows per task, with their input and output arrays
+# in shared memory. The processes are forked, so this needs Linux or macOS.
+use_processes = False
+
+# Run annual-seasons.py and make-regression-netcdf.py over tiles of tile_size x tile_size grid
+# cells on `workers` threads, writing each tile straight into the output file, so that memory
+# scales with the tile size instead of the grid, e.g. for ERA5-Land at 0.1°. Keep it a multiple
+# of cube_chunk. None processes the whole grid, or bands of it, as above.
+tile_size = None
+
+# Save each band of latitude rows that annual-seasons.py and make-regression-netcdf.py finish to
+# data/output/checkpoints, so that a run that is killed resumes where it stopped (not with use_dask)
+use_checkpoints = True
+
+# make-city-files.py writes the city series and trends in NetCDF shards of this many cities,
+# and optionally one JSON file per city as well
+city_shard_size = 1000000
+export_city_json = True
+
+# Address of the point-query service (scripts/serve-points.py) and how many grid cells it keeps in memory
+service_host = "127.0.0.1"
+service_port = 8000
+service_cache_size = 4096
+
+# Also save the Theil–Sen slope and intercept and the Mann–Kendall trend test of each season
+# in make-regression-netcdf.py, as {season}_sen_slope, {season}_mk_pvalue, etc.
+robust_trends = True
+
+# Also save a block bootstrap confidence interval of each season's slope in make-regression-netcdf.py,
+# as {season}_slope_ci_low and {season}_slope_ci_high, from this many resamples (0 to skip). The same
+# resamples of years are used for every cell. bootstrap_block_length = None uses the cube root of
+# the number of years.
+bootstrap_resamples = 0
+bootstrap_block_length = None
+bootstrap_confidence = 0.95
+bootstrap_seed = 0
+
+# Percentiles of each season's temperatures in each cell saved by make-records-netcdf.py, as
+# {season}_p10 etc., next to the rank of every year and the record highs and lows
+record_percentiles = [10, 50, 90]
+
+# Variables of the slopes file that draw-rasters.js maps. convert-to-v3.py and export-flat.py
+# only copy these, and the coordinates, into the files for it.
+map_variables = ["summer_slope", "winter_slope"]
+
+# Pack the slope variables into int16 with scale_factor/add_offset in convert-to-v3.py. Variables
+# whose maximum quantization error would be larger than v3_precision stay float32.
+v3_pack = False
+v3_precision = 0.0001
+
+# Every Python stage saves a JSON report of its phases to data/output/reports. Set profile_stages
+# to also profile each run with cProfile and list the hottest functions in the report.
+profile_stages = False
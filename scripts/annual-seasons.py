@@ -1,103 +1,170 @@
 import os
 import numpy as np
+import dask.array as da
 import xarray as xr
 from tqdm import tqdm  # Import tqdm for progress bars
 
-from CONFIG import start_year, end_year, engine, file_name
-
-# Function to determine hemisphere
-def get_hemisphere(latitude):
-    return "north" if latitude >= 0 else "south"
-
-# Function to convert Kelvin to Fahrenheit
-def kelvin_to_fahrenheit(kelvin):
-    return (kelvin - 273.15) * 9/5 + 32
-
-# Function to get the season based on month and hemisphere
-def get_season(month, hemisphere):
-    if hemisphere == "north":
-        if month in [6, 7, 8]:
-            return "summer"
-        if month in [12, 1, 2]:
-            return "winter"
-    elif hemisphere == "south":
-        if month in [6, 7, 8]:
-            return "winter"
-        if month in [12, 1, 2]:
-            return "summer"
-    return None  # For months not included in summer or winter
-
-# Define the file path
-dirname = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(dirname, "data", "input", file_name)
-output_dir = os.path.join(dirname, "data", "output", "year")
+from CONFIG import start_year, end_year, export_yearly_files, band_size, use_dask, use_processes, use_checkpoints, tile_size
+from utils.store import open_input, input_fingerprint
+from utils.seasons import SEASONS, compose_seasons, kelvin_to_fahrenheit, cube_encoding, cube_dtype
+from utils.compute import chunk_along
+from utils.parallel import SharedArrays, map_bands
+from utils.checkpoint import Checkpoint
+from utils.tiles import TiledWriter, grid_tiles, map_tiles
+from utils.instrument import start_run
+
+run = start_run(__file__)
 
-# Open the gridded file from Copernicus using xarray
-ds = xr.open_dataset(file_path, engine=engine)
+# Define the file paths
+dirname = os.path.dirname(os.path.abspath(__file__))
+output_file = os.path.join(dirname, "data", "output", f"seasonal_temps_{start_year}_{end_year}.nc")
+year_dir = os.path.join(dirname, "data", "output", "year")
 
-# Filter the dataset for expver = 1
-if engine == "netcdf4":
-    ds = ds.sel(expver=1)
+# Open the ERA5 store, which already has expver selected and longitudes in the range -180 to 180
+run.phase("load")
+ds = open_input()
 
-# Filter the dataset for the required years
+# Filter the dataset for the required years, including the previous year for December, and
+# the next year for seasons counted in the year they start in
+run.phase("filter")
 print("Filtering the dataset for the required years")
-ds = ds.sel(time=slice(f"{start_year-1}-01-01", f"{end_year}-12-31"))
-
-# Adjust longitudes to be in the range -180 to 180
-ds = ds.assign_coords(longitude=(((ds.longitude + 180) % 360) - 180)).sortby('longitude')
-
-# Loop through each year to calculate seasonal temperatures
-for year in tqdm(range(start_year, end_year + 1), desc="Processing years"):
-
-    # Filter data for the current and previous year (for winter calculations)
-    yearly_data = ds["t2m"].sel(time=slice(f"{year-1}-12-01", f"{year}-08-31"))
-
-    # Determine the latitude and longitude values
-    lats = yearly_data.latitude.values
-    lons = yearly_data.longitude.values
-    
-    # Initialize arrays to store seasonal temperature values
-    seasonal_temps = {
-        "summer": np.full((len(lats), len(lons)), np.nan),
-        "winter": np.full((len(lats), len(lons)), np.nan)
-    }
-    
-    # Iterate over each month to calculate seasonal temperatures
-    for month in range(1, 13):
-        # Determine the hemisphere for each grid cell
-        hemisphere = np.vectorize(get_hemisphere)(lats)
-        
-        # Determine the season for each grid cell
-        season = np.vectorize(get_season)(month, hemisphere)
-        
-        # Filter the data for the current month
-        monthly_data = yearly_data.sel(time=yearly_data.time.dt.month == month)
-        
-        if monthly_data.time.size > 0:
-            # Calculate the mean temperature for the month
-            mean_temp = monthly_data.mean(dim="time")
-            mean_temp_f = kelvin_to_fahrenheit(mean_temp)
-            
-            # Update the seasonal temperatures
-            for s in seasonal_temps:
-                mask = (season == s)
-                if np.any(mask):
-                    seasonal_temps[s][mask] = mean_temp_f.values[mask]
-    
-    # Create a new dataset with seasonal temperatures
+last_year = end_year + 1 if any(SEASONS[season]["year"] == "start" for season in SEASONS) else end_year
+ds = ds.sel(time=slice(f"{start_year-1}-01-01", f"{last_year}-12-31"))
+
+years = np.arange(start_year, end_year + 1)
+times = ds.time.values
+lats = ds.latitude.values
+lons = ds.longitude.values
+
+# Function to compose the seasons for every year from one latitude band of monthly data,
+# with seasons and years flattened into the first axis
+def compose_band(monthly_data, band_lats):
+    seasonal = compose_seasons(monthly_data.astype(np.float64), times, band_lats.ravel(), years)
+    return kelvin_to_fahrenheit(seasonal).reshape((-1,) + monthly_data.shape[1:])
+
+# Function to compose one band of the shared monthly data into the shared seasons, in a worker process
+def compose_task(band, arrays):
+    arrays["seasonal"][:, band] = compose_band(arrays["monthly"][:, band], lats[band])
+
+# Checkpoint every band or tile of seasons as it finishes, stored in the type of the output file, so
+# a run that is killed can resume from the same input and seasons
+checkpoint = None
+if use_checkpoints and (tile_size or not use_dask):
+    checkpoint = Checkpoint(run.stage, {
+        "input": input_fingerprint(ds),
+        "years": [start_year, end_year],
+        "seasons": SEASONS,
+        "dtype": str(np.dtype(cube_dtype)),
+    })
+
+# Function to fill a band of the seasons from its checkpoint, returning whether there was one
+def restore_band(band, seasonal):
+    saved = checkpoint.load(f"rows {band.start}-{band.stop}") if checkpoint else None
+    if saved is None:
+        return False
+    seasonal[:, band] = saved["seasonal"]
+    return True
+
+# Function to checkpoint a finished band of the seasons
+def save_band(band, seasonal):
+    if checkpoint:
+        checkpoint.save(f"rows {band.start}-{band.stop}", seasonal=seasonal[:, band].astype(cube_dtype))
+
+# Function to load the seasons of a tile from its checkpoint, or None if it has none
+def restore_tile(tile):
+    saved = checkpoint.load(str(tile)) if checkpoint else None
+    return None if saved is None else saved["seasonal"]
+
+# Function to checkpoint the seasons of a finished tile and write them to the output file
+def write_tile(tile, seasonal):
+    if checkpoint:
+        checkpoint.save(str(tile), seasonal=seasonal.astype(cube_dtype))
+    for s, season in enumerate(SEASONS):
+        writer.write(season, tile, seasonal[s * len(years):(s + 1) * len(years)])
+
+# Compose the seasons for every year in one pass over the time axis, a band of latitudes at a time
+run.phase("reduce", items=ds["t2m"].size)
+os.makedirs(os.path.dirname(output_file), exist_ok=True)
+n_values = len(SEASONS) * len(years) * len(lats) * len(lons)
+if tile_size:
+    # Or a tile at a time on a pool of threads, written straight into the output file, so the
+    # whole grid is never in memory. The encoding comes from a lazy template of the output.
+    template = xr.Dataset({
+        season: (["year", "latitude", "longitude"], da.zeros((len(years), len(lats), len(lons))))
+        for season in SEASONS
+    })
+    writer = TiledWriter(
+        output_file,
+        {"year": years, "latitude": lats, "longitude": lons},
+        {season: ("year", "latitude", "longitude") for season in SEASONS},
+        cube_encoding(template)
+    )
+    map_tiles(
+        grid_tiles(len(lats), len(lons), tile_size),
+        read=lambda tile: ds["t2m"].isel(latitude=tile.read_rows, longitude=tile.read_cols).values,
+        compute=lambda tile, monthly: tile.trim(compose_band(monthly, lats[tile.read_rows])),
+        write=write_tile,
+        restore=restore_tile
+    )
+    run.phase("write", items=n_values)
+    writer.close()
+elif use_dask:
+    # Lazily, with the bands sized to fit the memory limit and run in parallel when saving
+    monthly_data = chunk_along(ds["t2m"], "latitude").data
+    band_lats = da.from_array(lats, chunks=monthly_data.chunks[1])[None, :, None]
+    seasonal_temps = da.map_blocks(
+        compose_band, monthly_data, band_lats,
+        chunks=((len(SEASONS) * len(years),),) + monthly_data.chunks[1:],
+        dtype=np.float64
+    ).reshape((len(SEASONS), len(years), len(lats), len(lons)))
+elif use_processes:
+    # On a pool of worker processes, with the monthly data and the seasons in shared memory
+    with SharedArrays() as shared:
+        shared.load("monthly", ds["t2m"])
+        seasonal = shared.empty("seasonal", (len(SEASONS) * len(years), len(lats), len(lons)))
+        map_bands(
+            compose_task, len(lats), shared.arrays,
+            restore=lambda band: restore_band(band, seasonal),
+            save=lambda band: save_band(band, seasonal)
+        )
+        seasonal_temps = shared["seasonal"].reshape((len(SEASONS), len(years), len(lats), len(lons))).copy()
+else:
+    seasonal_temps = np.full((len(SEASONS) * len(years), len(lats), len(lons)), np.nan)
+    for start in tqdm(range(0, len(lats), band_size), desc="Processing latitude bands"):
+        band = slice(start, start + band_size)
+        if not restore_band(band, seasonal_temps):
+            seasonal_temps[:, band] = compose_band(ds["t2m"].isel(latitude=band).values, lats[band])
+            save_band(band, seasonal_temps)
+    seasonal_temps = seasonal_temps.reshape((len(SEASONS), len(years), len(lats), len(lons)))
+
+if not tile_size:
+    # Create a new dataset with the seasonal temperatures in every year
     seasonal_ds = xr.Dataset(
-        {season: (["latitude", "longitude"], seasonal_temps[season]) for season in seasonal_temps},
+        {season: (["year", "latitude", "longitude"], seasonal_temps[s]) for s, season in enumerate(SEASONS)},
         coords={
+            "year": years,
             "latitude": lats,
             "longitude": lons
         }
     )
-    
-    # Define output file path
-    output_file = os.path.join(output_dir, f"seasonal_temps_{year}.nc")
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    
-    # Save to NetCDF file
-    seasonal_ds.to_netcdf(output_file, engine="netcdf4")
-
-print("All seasonal temperatures files have been saved to the data/output/year folder.")
+
+    # Save to NetCDF file (with dask, the seasons are composed while saving), through a temporary
+    # file so a run that is killed never leaves a file that looks complete
+    run.phase("write", items=n_values)
+    seasonal_ds.to_netcdf(f"{output_file}.tmp", engine="netcdf4", encoding=cube_encoding(seasonal_ds))
+    os.replace(f"{output_file}.tmp", output_file)
+if checkpoint:
+    checkpoint.clear()
+print(f"Saved data/output/{os.path.basename(output_file)}")
+
+# Optionally save one file per year as well, from the saved file so nothing is recomputed
+if export_yearly_files:
+    run.phase("write year files", items=n_values)
+    seasonal_ds = xr.open_dataset(output_file, engine="netcdf4")
+    os.makedirs(year_dir, exist_ok=True)
+    for year in tqdm(years, desc="Saving year files"):
+        year_file = os.path.join(year_dir, f"seasonal_temps_{year}.nc")
+        year_ds = seasonal_ds.sel(year=year, drop=True)
+        year_ds.to_netcdf(f"{year_file}.tmp", engine="netcdf4", encoding=cube_encoding(year_ds))
+        os.replace(f"{year_file}.tmp", year_file)
+    print("All seasonal temperatures files have been saved to the data/output/year folder.")
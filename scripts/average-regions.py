@@ -0,0 +1,64 @@
+import os
+
+from CONFIG import end_year
+from utils.store import open_input
+from utils.regions import monthly_region_means, annual_region_means
+from utils.instrument import start_run
+start_year = 1940
+
+run = start_run(__file__)
+print("Averaging annual and monthly temperatures across the whole grid, the hemispheres and the poles...")
+
+# Function to convert Kelvin to Fahrenheit
+def kelvin_to_fahrenheit(kelvin):
+    return (kelvin - 273.15) * 9/5 + 32
+
+# Function to convert Kelvin to Celsius
+def kelvin_to_celsius(kelvin):
+    return kelvin - 273.15
+
+# Open the ERA5 store
+run.phase("load")
+dirname = os.path.dirname(os.path.abspath(__file__))
+ds = open_input()
+
+# Filter the dataset for the required years
+ds = ds.sel(time=slice(f"{start_year}-01-01", f"{end_year}-12-31"))
+
+# Calculate the weighted mean of every region in every month, then in every year
+run.phase("reduce", items=ds["t2m"].size)
+monthly = monthly_region_means(ds["t2m"])
+annual = annual_region_means(monthly)
+
+# Function to reshape the means of some regions into one row per region and time, with temperatures in K, F and C
+def to_rows(means, regions, region_column):
+    rows = means[regions].rename_axis(columns=region_column).stack().rename("temp_k").reset_index().dropna(subset=["temp_k"])
+    rows["temp_f"] = rows["temp_k"].apply(kelvin_to_fahrenheit)
+    rows["temp_c"] = rows["temp_k"].apply(kelvin_to_celsius)
+    return rows
+
+# Prepare the output tables. Months without data, and years missing any month, are left out
+# of every table.
+annual_grid_df = annual[["globe"]].rename(columns={"globe": "temp_k"}).reset_index().dropna(subset=["temp_k"])
+annual_grid_df["temp_f"] = annual_grid_df["temp_k"].apply(kelvin_to_fahrenheit)
+annual_grid_df["temp_c"] = annual_grid_df["temp_k"].apply(kelvin_to_celsius)
+
+outputs = {
+    "annual_mean_temperatures.csv": annual_grid_df,
+    "monthly_mean_temperatures.csv": to_rows(monthly, ["north", "south"], "hemisphere"),
+    "annual_mean_temperatures_poles.csv": to_rows(annual, ["arctic", "antarctic"], "region"),
+    "monthly_mean_temperatures_poles.csv": to_rows(monthly, ["arctic", "antarctic"], "region"),
+}
+
+incomplete = annual.index[annual["globe"].isna()]
+if len(incomplete):
+    print(f"Leaving out the years that are missing months: {', '.join(map(str, incomplete))}")
+
+# Output the DataFrames to CSV files
+run.phase("write", items=sum(len(df) for df in outputs.values()), unit="rows")
+output_dir = os.path.join(dirname, "data", "output")
+os.makedirs(output_dir, exist_ok=True)
+for output_file, df in outputs.items():
+    df.to_csv(os.path.join(output_dir, output_file), index=False)
+    print(f"Saved data/output/{output_file}")
+print("\n")
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+from CONFIG import engine
+
+# The Python stages, in the order they depend on each other
+STAGES = [
+    "ingest-grib",
+    "average-regions",
+    "annual-seasons",
+    "make-regression-netcdf",
+    "make-records-netcdf",
+    "calculate-percentage",
+    "make-region-series",
+    "make-anomalies",
+    "make-city-lookup",
+    "make-city-files",
+    "export-flat",
+    "update-incremental",
+    "convert-to-v3",
+]
+
+# Time and memory-profile every stage against synthetic data in a scratch copy of the scripts,
+# so the real inputs and outputs are never touched
+parser = argparse.ArgumentParser(description="Benchmark every stage against synthetic ERA5-like data")
+parser.add_argument("--start-year", type=int, default=1990)
+parser.add_argument("--end-year", type=int, default=2023)
+parser.add_argument("--resolution", type=float, default=1.0, help="grid spacing in degrees (ERA5 is 0.25)")
+parser.add_argument("--cities", type=int, default=1000)
+parser.add_argument("--engine", default=engine, choices=["netcdf4", "cfgrib"])
+parser.add_argument("--dask", action="store_true", help="run with use_dask = True")
+parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES, help="stages to time (all of them run)")
+parser.add_argument("--repeat", type=int, default=1, help="runs of the whole pipeline, keeping the fastest of each stage")
+parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+args = parser.parse_args()
+
+# Define the file paths
+dirname = os.path.dirname(os.path.abspath(__file__))
+results_file = os.path.join(dirname, "data", "output", "benchmarks.jsonl")
+
+# Function to copy the scripts into a scratch directory, with empty inputs and outputs and
+# CONFIG overridden for the benchmark
+def make_workspace():
+    workspace = tempfile.mkdtemp(prefix="seasons-benchmark-")
+    shutil.copytree(dirname, workspace, dirs_exist_ok=True, ignore=shutil.ignore_patterns("data", "node_modules", "__pycache__"))
+    for folder in ["geo", "lookup"]:
+        shutil.copytree(os.path.join(dirname, "data", folder), os.path.join(workspace, "data", folder))
+    os.makedirs(os.path.join(workspace, "data", "input"))
+    os.makedirs(os.path.join(workspace, "data", "output"))
+
+    with open(os.path.join(workspace, "CONFIG.py"), "a") as f:
+        f.write(
+            "\n# Benchmark overrides\n"
+            f"start_year = {args.start_year}\n"
+            f"end_year = {args.end_year}\n"
+            f"engine = {args.engine!r}\n"
+            "file_name = f\"era5-monthly-temp.{'nc' if engine == 'netcdf4' else 'grib'}\"\n"
+            f"use_dask = {args.dask}\n"
+            f"climatology_start_year = {args.start_year}\n"
+            f"climatology_end_year = {min(args.start_year + 29, args.end_year)}\n"
+        )
+    return workspace
+
+# Function to run one script in the workspace, returning its wall time, CPU time and peak
+# resident memory, which the kernel reports for each child process separately
+def run_script(workspace, script, *script_args):
+    log_file = os.path.join(workspace, f"{script}.log")
+    start = time.perf_counter()
+    with open(log_file, "w") as log:
+        process = subprocess.Popen([sys.executable, f"{script}.py", *script_args], cwd=workspace, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+
+    if process.returncode != 0:
+        with open(log_file) as log:
+            print(log.read()[-2000:])
+        raise SystemExit(f"{script} failed with exit code {process.returncode}, see {log_file}")
+
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    stats = {"wall_s": wall, "cpu_s": usage.ru_utime + usage.ru_stime, "peak_rss_mb": peak_rss / 2 ** 20}
+
+    # Keep the phases from the stage's own run report. The report resets the kernel's peak at
+    # every phase, so the peak of the whole run is the larger of the two.
+    report_file = os.path.join(workspace, "data", "output", "reports", f"{script}.json")
+    if os.path.exists(report_file):
+        with open(report_file) as f:
+            report = json.load(f)
+        stats["phases"] = report["phases"]
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], report["total"]["peak_rss_mb"])
+    return stats
+
+# Function to find the last saved run with the same parameters, to compare against
+def previous_run(params):
+    if not os.path.exists(results_file):
+        return None
+    with open(results_file) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    matching = [run for run in runs if run["params"] == params]
+    return matching[-1] if matching else None
+
+# Function to get the current commit, if the scripts are in a git checkout
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=dirname, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+params = {
+    "start_year": args.start_year,
+    "end_year": args.end_year,
+    "resolution": args.resolution,
+    "cities": args.cities,
+    "engine": args.engine,
+    "dask": args.dask,
+}
+n_lats = int(round(180 / args.resolution)) + 1
+n_lons = int(round(360 / args.resolution))
+n_months = 12 * (args.end_year - args.start_year + 2)
+
+print(f"Benchmarking {args.start_year}-{args.end_year} at {args.resolution}° ({n_lats}x{n_lons} cells, {n_months} months)")
+
+results = {}
+for run in range(args.repeat):
+    workspace = make_workspace()
+    try:
+        run_script(workspace, "make-synthetic-data", "--resolution", str(args.resolution), "--cities", str(args.cities))
+        for stage in STAGES:
+            stats = run_script(workspace, stage)
+            if stage in args.stages and (stage not in results or stats["wall_s"] < results[stage]["wall_s"]):
+                results[stage] = stats
+    finally:
+        if args.keep:
+            print(f"Kept the scratch directory {workspace}")
+        else:
+            shutil.rmtree(workspace)
+
+# Throughput in grid cells times months of input per second, comparable across resolutions and spans
+for stats in results.values():
+    stats["cell_months_per_s"] = n_lats * n_lons * n_months / stats["wall_s"]
+
+# Print the results next to the last run with the same parameters
+previous = previous_run(params)
+print(f"\n{'stage':<24}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'Mcell-months/s':>16}{'vs last':>10}")
+for stage, stats in results.items():
+    change = ""
+    if previous and stage in previous["stages"]:
+        change = f"{stats['wall_s'] / previous['stages'][stage]['wall_s'] - 1:+.0%}"
+    print(
+        f"{stage:<24}{stats['wall_s']:>10.2f}{stats['cpu_s']:>10.2f}{stats['peak_rss_mb']:>10.0f}"
+        f"{stats['cell_months_per_s'] / 1e6:>16.1f}{change:>10}"
+    )
+
+# Save the run so later runs can be compared with it
+record = {
+    "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    "commit": git_commit(),
+    "params": params,
+    "stages": results,
+}
+os.makedirs(os.path.dirname(results_file), exist_ok=True)
+with open(results_file, "a") as f:
+    f.write(json.dumps(record) + "\n")
+print(f"\nSaved the results to data/output/{os.path.basename(results_file)}")
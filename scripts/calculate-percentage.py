@@ -1,10 +1,28 @@
 import os
 import numpy as np
 import xarray as xr
-from tqdm import tqdm
 import json
 
-from CONFIG import start_year, end_year
+from CONFIG import start_year, end_year, use_processes
+from utils.area import cos_latitude_weights, condition_row_areas, area_fractions
+from utils.parallel import SharedArrays, map_bands
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+# Conditions to measure, as comparisons over the variables in the slopes file
+# joined with "&". Each side is a number, a variable, "abs(variable)" or
+# "number * variable". latitude and longitude are also available, broadcast to
+# the grid, so new conditions like
+# "(winter_slope > 2 * summer_slope) & (abs(latitude) >= 66.5)" only need a new
+# line here.
+conditions = {
+    "winter_faster": "winter_slope > summer_slope",
+    "both_negative": "(summer_slope < 0) & (winter_slope < 0)",
+    "both_positive": "(summer_slope > 0) & (winter_slope > 0)",
+    "winter_positive_summer_negative": "(summer_slope > 0) & (winter_slope < 0)",
+    "summer_positive_winter_negative": "(summer_slope < 0) & (winter_slope > 0)",
+}
 
 # Define file paths
 dirname = os.path.dirname(os.path.abspath(__file__))
@@ -15,72 +33,43 @@ output_file_path = os.path.join(dirname, "data", "output", "percentage-analysis.
 print(f"Calculating % of Earth's surface where certain conditions are met in {input_file_name}")
 
 # Load the NetCDF file using xarray
+run.phase("load")
 ds = xr.open_dataset(input_file_path)
 
-# Extract latitude, summer_slope, and winter_slope
-latitudes = ds["latitude"]
-winter_slope = ds["winter_slope"]
-summer_slope = ds["summer_slope"]
-
-# Create a boolean mask where winter_slope > summer_slope
-winter_faster_mask = winter_slope > summer_slope
+# Weight each grid cell by the cosine of its latitude, so the areas keep the units they have
+# always had in percentage-analysis.json
+lats = ds["latitude"].values
+lons = ds["longitude"].values
+weights = cos_latitude_weights(lats, lons)
 
-# Create a boolean mask where both summer_slope and winter_slope are negative
-both_negative_mask = (summer_slope < 0) & (winter_slope < 0)
-both_positive_mask = (summer_slope > 0) & (winter_slope > 0)
-winter_positive_summer_negative_mask = (summer_slope > 0) & (winter_slope < 0)
-summer_positive_winter_negative_mask = (summer_slope < 0) & (winter_slope > 0)
+# Collect the grids the conditions can refer to
+lon_grid, lat_grid = np.meshgrid(lons, lats)
+variables = {name: ds[name].values for name in ds.data_vars if ds[name].dims == ("latitude", "longitude")}
+variables["latitude"] = lat_grid
+variables["longitude"] = lon_grid
 
-# Calculate latitude weights (cosine of latitude)
-latitude_weights = np.cos(np.deg2rad(latitudes))
+# Function to calculate the area of each condition in one band of rows, in a worker process
+def condition_task(band, arrays):
+    band_variables = {name: arrays[f"variable_{name}"][band] for name in variables}
+    arrays["row_areas"][:, band] = condition_row_areas(conditions, band_variables, arrays["weights"][band])
 
-# Initialize variables for calculating areas
-earth_area = 0
-winter_faster_area = 0
-both_negative_area = 0
-both_positive_area = 0
-winter_positive_summer_negative_area = 0
-summer_positive_winter_negative_area = 0
-
-# Iterate over the data with progress logging using tqdm
-for lat_idx in tqdm(range(len(latitudes)), desc="Processing latitude bands"):
-    lat_weight = latitude_weights[lat_idx].item()
-    for lon_idx in range(len(ds["longitude"])):
-        if winter_faster_mask.isel(latitude=lat_idx, longitude=lon_idx).item():
-            winter_faster_area += lat_weight
-        if both_negative_mask.isel(latitude=lat_idx, longitude=lon_idx).item():
-            both_negative_area += lat_weight
-        if both_positive_mask.isel(latitude=lat_idx, longitude=lon_idx).item():
-            both_positive_area += lat_weight
-        if winter_positive_summer_negative_mask.isel(latitude=lat_idx, longitude=lon_idx).item():
-            winter_positive_summer_negative_area += lat_weight
-        if summer_positive_winter_negative_mask.isel(latitude=lat_idx, longitude=lon_idx).item():
-            summer_positive_winter_negative_area += lat_weight
-        earth_area += lat_weight
-
-# Calculate the percentage of Earth's surface for each condition
-winter_faster_percentage = (winter_faster_area / earth_area) * 100
-both_negative_percentage = (both_negative_area / earth_area) * 100
-both_positive_percentage = (both_positive_area / earth_area) * 100
-winter_positive_summer_negative_percentage = (winter_positive_summer_negative_area / earth_area) * 100
-summer_positive_winter_negative_percentage = (summer_positive_winter_negative_area / earth_area) * 100
-
-# Prepare the output data
-output_data = {
-    "earth_area": earth_area,
-    "winter_faster_area": winter_faster_area,
-    "winter_faster_percentage": winter_faster_percentage,
-    "both_negative_area": both_negative_area,
-    "both_negative_percentage": both_negative_percentage,
-    "both_positive_area": both_positive_area,
-    "both_positive_percentage": both_positive_percentage,
-    "winter_positive_summer_negative_area": winter_positive_summer_negative_area,
-    "winter_positive_summer_negative_percentage": winter_positive_summer_negative_percentage,
-    "summer_positive_winter_negative_area": summer_positive_winter_negative_area,
-    "summer_positive_winter_negative_percentage": summer_positive_winter_negative_percentage
-}
+# Calculate the area and percentage of Earth's surface for each condition
+run.phase("reduce", items=len(conditions) * lat_grid.size)
+if use_processes:
+    # On a pool of worker processes, a band of latitude rows at a time, with the grids in shared memory
+    with SharedArrays() as shared:
+        for name, values in variables.items():
+            shared.copy(f"variable_{name}", values)
+        shared.copy("weights", weights)
+        shared.empty("row_areas", (len(conditions), len(lats)))
+        map_bands(condition_task, len(lats), shared.arrays)
+        row_areas = shared["row_areas"].copy()
+    output_data = area_fractions(conditions, variables, weights, row_areas)
+else:
+    output_data = area_fractions(conditions, variables, weights)
 
 # Save the results to a JSON file
+run.phase("write")
 os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 with open(output_file_path, "w") as json_file:
     json.dump(output_data, json_file, indent=4)
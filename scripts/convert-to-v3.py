@@ -2,17 +2,60 @@ import os
 import netCDF4 as nc
 import numpy as np
 
-from CONFIG import start_year, end_year
+from CONFIG import start_year, end_year, v3_pack, v3_precision, map_variables
+from utils.instrument import start_run
+
+run = start_run(__file__)
 
 dirname = os.path.dirname(os.path.abspath(__file__))
 input_file_name = f"seasonal_slopes_{start_year}_{end_year}.nc"
 input_file = os.path.join(dirname, "data", "output", input_file_name)
 output_file = os.path.join(dirname, "data", "output", f"seasonal_slopes_{start_year}_{end_year}_v3.nc")
-print(f"Converting {input_file_name} from V4 to V3")
+print(f"Converting {input_file_name} from V4 to V3{' with int16 packing' if v3_pack else ''}")
+
+# Most bytes of a variable copied at a time
+CHUNK_BYTES = 64 * 2 ** 20
+
+# Fill value of packed variables, leaving -32767..32767 for data
+PACKED_FILL = np.int16(-32768)
+PACKED_LEVELS = 2 * 32767
+
+# Function to split a variable into blocks along its first dimension of at most CHUNK_BYTES each
+def chunk_slices(variable):
+    if len(variable.shape) == 0:
+        return [()]
+    row_bytes = max(1, int(np.prod(variable.shape[1:], dtype=np.int64)) * variable.dtype.itemsize)
+    step = max(1, CHUNK_BYTES // row_bytes)
+    return [slice(start, start + step) for start in range(0, variable.shape[0], step)]
+
+# Function to read a block of a variable as plain floats, with missing values as NaN
+def read_block(variable, block):
+    return np.ma.filled(np.ma.asarray(variable[block], dtype=np.float64), np.nan)
 
-def convert_nc4_to_nc3(input_file, output_file):
+# Function to find the scale_factor and add_offset that spread a variable's range over int16,
+# streaming through the variable to find its minimum and maximum
+def packing_params(variable):
+    low, high = np.inf, -np.inf
+    for block in chunk_slices(variable):
+        data = read_block(variable, block)
+        if np.any(np.isfinite(data)):
+            low = min(low, np.nanmin(data))
+            high = max(high, np.nanmax(data))
+    if not np.isfinite(low):
+        return None, None
+    scale = (high - low) / PACKED_LEVELS or 1.0
+    return scale, (high + low) / 2
+
+# Function to convert a NetCDF-4 file to NetCDF-3, copying only the coordinates and the listed
+# variables, or every variable if variables is None
+def convert_nc4_to_nc3(input_file, output_file, pack=False, precision=None, variables=None):
     # Open the NetCDF-4 file
     src = nc.Dataset(input_file, "r")
+    if variables is not None:
+        missing = [name for name in variables if name not in src.variables]
+        if missing:
+            src.close()
+            run.fail(f"{os.path.basename(input_file)} has no variables {', '.join(missing)}")
     
     # Create a new NetCDF-3 file
     dst = nc.Dataset(output_file, "w", format="NETCDF3_CLASSIC")
@@ -25,34 +68,70 @@ def convert_nc4_to_nc3(input_file, output_file):
     for name, dimension in src.dimensions.items():
         dst.createDimension(name, len(dimension) if not dimension.isunlimited() else None)
     
-    # Copy variables
+    # Copy the coordinates and the variables
     for name, variable in src.variables.items():
+        if variables is not None and name not in src.dimensions and name not in variables:
+            continue
+
         # Handle unsupported data types
         datatype = variable.datatype
         if datatype == np.float64:
             datatype = np.float32  # NetCDF-3 does not support float64
         elif datatype == np.int64:
             datatype = np.int32  # NetCDF-3 does not support int64
-        
-        x = dst.createVariable(name, datatype, variable.dimensions)
+
+        # Pack data variables (not coordinates) into int16 if the quantization error is within the precision
+        scale, offset = None, None
+        if pack and name not in src.dimensions and np.issubdtype(variable.dtype, np.floating):
+            scale, offset = packing_params(variable)
+            if scale is not None and precision is not None and scale / 2 > precision:
+                print(f"Warning: Packing {name} would exceed the precision of {precision}, keeping it as float32")
+                scale, offset = None, None
+
+        if scale is not None:
+            x = dst.createVariable(name, np.int16, variable.dimensions, fill_value=PACKED_FILL)
+        else:
+            x = dst.createVariable(name, datatype, variable.dimensions, fill_value=getattr(variable, "_FillValue", None))
         
         # Copy variable attributes
         for attr_name in variable.ncattrs():
+            if attr_name == "_FillValue":
+                continue
             attr_value = variable.getncattr(attr_name)
             try:
                 x.setncattr(attr_name, attr_value)
             except Exception as e:
                 print(f"Warning: Attribute {attr_name} of variable {name} could not be copied: {e}")
+        if scale is not None:
+            x.setncattr("scale_factor", np.float32(scale))
+            x.setncattr("add_offset", np.float32(offset))
         
-        # Copy variable data
+        # Copy variable data in blocks, packing it if needed
+        if scale is not None:
+            x.set_auto_maskandscale(False)
+        max_error = 0.0
         try:
-            x[:] = variable[:]
+            for block in chunk_slices(variable):
+                if scale is None:
+                    x[block] = variable[block]
+                    continue
+                data = read_block(variable, block)
+                packed = np.clip(np.round((data - offset) / scale), -32767, 32767)
+                packed = np.where(np.isnan(data), PACKED_FILL, packed).astype(np.int16)
+                unpacked = packed * np.float32(scale) + np.float32(offset)
+                errors = np.abs(unpacked - data)[~np.isnan(data)]
+                max_error = max(max_error, errors.max(initial=0.0))
+                x[block] = packed
         except Exception as e:
             print(f"Warning: Data of variable {name} could not be copied: {e}")
+        if scale is not None:
+            print(f"Packed {name} as int16, maximum quantization error {max_error:.3g}")
     
     # Close the files
     src.close()
     dst.close()
 
 # Example usage
-convert_nc4_to_nc3(input_file, output_file)
+run.phase("convert")
+convert_nc4_to_nc3(input_file, output_file, pack=v3_pack, precision=v3_precision, variables=map_variables)
+print(f"Saved {os.path.basename(output_file)} ({os.path.getsize(output_file) / 2 ** 20:.1f} MB, from {os.path.getsize(input_file) / 2 ** 20:.1f} MB)")
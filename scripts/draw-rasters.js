@@ -8,6 +8,7 @@ const topojson = require("topojson-client"); // TopoJSON client for working with
 
 // Import custom utility functions
 const convertTemp = require("./utils/convertTemp"); // Function to convert temperatures
+const { readFlat } = require("./utils/readFlat"); // Reader for flat binary exports
 const { unit } = require("./utils/config"); // Config file that specifies the unit (e.g., "change")
 
 // Read the start and end years from CONFIG.py file
@@ -24,19 +25,51 @@ const topo = JSON.parse(fs.readFileSync(`${__dirname}/data/geo/topo_110m.topo.js
 const countriesGeoInner = topojson.mesh(topo, topo.objects.countries, (a, b) => a !== b); // Inner country borders
 const countriesGeoOuter = topojson.mesh(topo, topo.objects.countries, (a, b) => a === b); // Outer country borders
 
-// Define the NetCDF file containing seasonal slope data
-const filename = `data/output/seasonal_slopes_${start_year}_${end_year}_v3.nc`;
-console.log(`\n\nDrawing raster from ${filename}`);
-const nc = new netcdf(fs.readFileSync(`${__dirname}/${filename}`));
+// Function to read a NetCDF variable, applying its scale_factor and add_offset and turning its _FillValue into NaN
+function getUnpackedVariable(nc, name) {
+  const values = nc.getDataVariable(name);
+  const { attributes } = nc.variables.find(d => d.name === name);
+  const attribute = key => {
+    const a = attributes.find(d => d.name === key);
+    return a && (Array.isArray(a.value) ? a.value[0] : a.value);
+  };
+  const scale = attribute("scale_factor");
+  const offset = attribute("add_offset");
+  if (scale === undefined && offset === undefined) return values;
+
+  const fill = attribute("_FillValue");
+  return values.map(v => v === fill ? NaN : v * (scale ?? 1) + (offset ?? 0));
+}
 
-// Extract seasonal slope data for winter and summer
-const winter = nc.getDataVariable("winter_slope");
-const summer = nc.getDataVariable("summer_slope");
-const values = { winter, summer };
+// Define the files containing seasonal slope data: the flat binary export (scripts/export-flat.py) is read
+// straight into typed arrays when it exists, otherwise the NetCDF-3 file is read with netcdfjs
+const flatFilename = `data/output/seasonal_slopes_${start_year}_${end_year}.bin`;
+const ncFilename = `data/output/seasonal_slopes_${start_year}_${end_year}_v3.nc`;
+let winter, summer, X, Y;
+
+if (fs.existsSync(`${__dirname}/${flatFilename}`)) {
+  console.log(`\n\nDrawing raster from ${flatFilename}`);
+  const { coords, variables } = readFlat(`${__dirname}/${flatFilename}`);
+
+  // Extract seasonal slope data for winter and summer, and the longitude and latitude coordinates
+  winter = variables.winter_slope;
+  summer = variables.summer_slope;
+  X = coords.longitude;
+  Y = coords.latitude;
+}
+else {
+  console.log(`\n\nDrawing raster from ${ncFilename}`);
+  const nc = new netcdf(fs.readFileSync(`${__dirname}/${ncFilename}`));
 
-// Extract longitude and latitude data from the NetCDF file
-const X = nc.getDataVariable("longitude");
-const Y = nc.getDataVariable("latitude");
+  // Extract seasonal slope data for winter and summer, unpacking them if convert-to-v3.py packed them into int16
+  winter = getUnpackedVariable(nc, "winter_slope");
+  summer = getUnpackedVariable(nc, "summer_slope");
+
+  // Extract longitude and latitude data from the NetCDF file
+  X = nc.getDataVariable("longitude");
+  Y = nc.getDataVariable("latitude");
+}
+const values = { winter, summer };
 
 // Calculate the resolution of the grid cells based on longitude values
 const cell_res = d3.median(d3.pairs(X), ([a, b]) => Math.abs(a - b));
@@ -48,47 +81,46 @@ console.log("Creating data");
 // Create GeoJSON features for each grid cell with associated seasonal data
 const geo = {
   type: "FeatureCollection",
-  features: winter
-    .map((_, i) => {
-      const lon = X[i % X.length]; // Calculate longitude for the current grid cell
-      const lat = Y[i / X.length | 0]; // Calculate latitude for the current grid cell
-      const properties = { lon, lat }; // Store the coordinates as properties
-
-      // Calculate temperature changes for each season and store them in properties
-      seasons.forEach(s => {
-        properties[`${s}_decadal`] = values[s][i] * 10;
-        properties[`${s}_change`] = values[s][i] * (end_year - start_year);
-        properties[`${s}_change_c`] = convertTemp(properties[`${s}_change`], { input: "f", output: "c", degree: false });
-      });
-
-      // Define the bounding box for the current grid cell
-      let w = Math.max(-180, lon - cell_res);
-      let e = Math.min(180, lon + cell_res);
-      let n = Math.min(90, lat + cell_res);
-      let s = Math.max(-90, lat - cell_res);
-  
-      // Adjust the bounding box if the grid cell crosses the equator or prime meridian
-      if (n > 0 && s < 0) {
-        if (lon > 0) s = 0;
-        if (lon < 0) n = 0;
-      }
+  features: Array.from(winter, (_, i) => {
+    const lon = X[i % X.length]; // Calculate longitude for the current grid cell
+    const lat = Y[i / X.length | 0]; // Calculate latitude for the current grid cell
+    const properties = { lon, lat }; // Store the coordinates as properties
+
+    // Calculate temperature changes for each season and store them in properties
+    seasons.forEach(s => {
+      properties[`${s}_decadal`] = values[s][i] * 10;
+      properties[`${s}_change`] = values[s][i] * (end_year - start_year);
+      properties[`${s}_change_c`] = convertTemp(properties[`${s}_change`], { input: "f", output: "c", degree: false });
+    });
+
+    // Define the bounding box for the current grid cell
+    let w = Math.max(-180, lon - cell_res);
+    let e = Math.min(180, lon + cell_res);
+    let n = Math.min(90, lat + cell_res);
+    let s = Math.max(-90, lat - cell_res);
+
+    // Adjust the bounding box if the grid cell crosses the equator or prime meridian
+    if (n > 0 && s < 0) {
+      if (lon > 0) s = 0;
+      if (lon < 0) n = 0;
+    }
 
-      // Log the progress percentage
-      logpct((i + 1) / winter.length * 100);
-
-      // Return the GeoJSON feature for the current grid cell
-      return {
-        type: "Feature",
-        properties,
-        geometry: {
-          type: "Polygon",
-          // Define the polygon using the bounding box coordinates
-          coordinates: [
-            [[w, n], [e, n], [e, s], [w, s], [w, n]]
-          ]
-        }
+    // Log the progress percentage
+    logpct((i + 1) / winter.length * 100);
+
+    // Return the GeoJSON feature for the current grid cell
+    return {
+      type: "Feature",
+      properties,
+      geometry: {
+        type: "Polygon",
+        // Define the polygon using the bounding box coordinates
+        coordinates: [
+          [[w, n], [e, n], [e, s], [w, s], [w, n]]
+        ]
       }
-    })
+    }
+  })
 }
 
 // Define geographic projections for the world, North America, and the Arctic
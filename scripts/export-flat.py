@@ -0,0 +1,32 @@
+import os
+import xarray as xr
+
+from CONFIG import start_year, end_year, map_variables
+from utils.seasons import open_seasonal_cube
+from utils.flat_binary import write_flat
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+# Define the file paths
+dirname = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(dirname, "data", "output")
+slopes_file = os.path.join(output_dir, f"seasonal_slopes_{start_year}_{end_year}.nc")
+
+# Export the seasonal temperatures, and the slopes that draw-rasters.js maps, as flat binary files
+slopes_ds = xr.open_dataset(slopes_file, engine="netcdf4")
+missing = [name for name in map_variables if name not in slopes_ds.data_vars]
+if missing:
+    run.fail(f"{os.path.basename(slopes_file)} has no variables {', '.join(missing)}")
+exports = {
+    f"seasonal_temps_{start_year}_{end_year}.bin": open_seasonal_cube(start_year, end_year),
+    f"seasonal_slopes_{start_year}_{end_year}.bin": slopes_ds[map_variables],
+}
+for output_file, ds in exports.items():
+    if ds is None:
+        print(f"No data for {output_file}, skipping.")
+        continue
+    print(f"Exporting {output_file}")
+    run.phase(f"write {output_file}", items=sum(ds[name].size for name in ds.data_vars), unit="values")
+    write_flat(ds, os.path.join(output_dir, output_file))
+    print(f"Saved data/output/{output_file}")
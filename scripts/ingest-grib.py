@@ -0,0 +1,8 @@
+from utils.store import ingest
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+# Decode the ERA5 input file into the store that every stage reads from
+run.phase("ingest")
+run.count(ingest())
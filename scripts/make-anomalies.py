@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+import dask.array as da
+import xarray as xr
+
+from CONFIG import start_year, end_year, band_size, cube_chunk, store_chunks
+from CONFIG import climatology_start_year, climatology_end_year
+from utils.store import open_input, store_encoding
+from utils.seasons import SEASONS, output_dir, open_seasonal_cube, kelvin_to_fahrenheit, cube_encoding
+from utils.climatology import load_climatology, seasonal_climatology
+from utils.region_masks import load_region_weights, region_means
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+baseline = f"{climatology_start_year}-{climatology_end_year}"
+print(f"Calculating temperature anomalies against the {baseline} baseline")
+
+# Open the ERA5 store
+run.phase("load")
+ds = open_input()
+lats = ds.latitude.values
+lons = ds.longitude.values
+
+# Load the per-cell climatology of every month, computing it only if it isn't cached for this
+# baseline and input yet
+run.phase("climatology")
+climatology = load_climatology(ds, climatology_start_year, climatology_end_year).values
+season_baselines = dict(zip(SEASONS, kelvin_to_fahrenheit(seasonal_climatology(climatology, lats))))
+
+# Function to subtract the climatology of each month from a block of monthly data, in °F
+def monthly_anomaly_block(block, block_months):
+    return (block.astype(np.float64) - climatology[block_months.ravel() - 1]) * 9/5
+
+# Stream the monthly anomalies to NetCDF a year of months at a time, in the layout of the store
+t2m = ds["t2m"].sel(time=slice(f"{start_year}-01-01", f"{end_year}-12-31"))
+run.phase("write monthly", items=t2m.size)
+monthly_data = t2m.chunk({"time": store_chunks["time"], "latitude": -1, "longitude": -1}).data
+block_months = da.from_array(t2m.time.dt.month.values, chunks=monthly_data.chunks[0])[:, None, None]
+monthly_ds = xr.Dataset(
+    {"anomaly": (["time", "latitude", "longitude"], da.map_blocks(monthly_anomaly_block, monthly_data, block_months, dtype=np.float64))},
+    coords={"time": t2m.time.values, "latitude": lats, "longitude": lons},
+    attrs={"baseline": baseline, "units": "°F"}
+)
+output_file = os.path.join(output_dir, f"monthly_anomalies_{start_year}_{end_year}.nc")
+os.makedirs(output_dir, exist_ok=True)
+monthly_ds.to_netcdf(output_file, engine="netcdf4", encoding={"anomaly": store_encoding(monthly_ds["anomaly"])})
+print(f"Saved data/output/{os.path.basename(output_file)}")
+
+# Stream the seasonal anomalies from the seasonal temperatures, if they exist, in bands of whole
+# latitude rows in multiples of the chunk size so that every chunk is written once
+seasonal_ds = open_seasonal_cube(start_year, end_year)
+if seasonal_ds is not None:
+    seasons = list(seasonal_ds.data_vars)
+    run.phase("write seasonal", items=sum(seasonal_ds[season].size for season in seasons))
+    rows = max(cube_chunk, band_size // cube_chunk * cube_chunk)
+    seasonal_ds = seasonal_ds.chunk({"year": -1, "latitude": rows, "longitude": -1})
+    anomaly_ds = xr.Dataset(
+        {season: seasonal_ds[season] - xr.DataArray(season_baselines[season], dims=["latitude", "longitude"]) for season in seasons},
+        attrs={"baseline": baseline, "units": "°F"}
+    )
+    output_file = os.path.join(output_dir, f"seasonal_anomalies_{start_year}_{end_year}.nc")
+    anomaly_ds.to_netcdf(output_file, engine="netcdf4", encoding=cube_encoding(anomaly_ds))
+    print(f"Saved data/output/{os.path.basename(output_file)}")
+
+# The anomaly of a region's mean is its mean less the region's mean of the climatology, so the
+# region series from make-region-series.py only need the climatology averaged over each region
+monthly_file = os.path.join(output_dir, "monthly_mean_temperatures_regions.csv")
+seasonal_file = os.path.join(output_dir, "seasonal_mean_temperatures_regions.csv")
+if os.path.exists(monthly_file) or os.path.exists(seasonal_file):
+    run.phase("regions")
+    regions, weights = load_region_weights(lats, lons)
+else:
+    print("No region series found, run make-region-series.py first for the region anomalies")
+
+if os.path.exists(monthly_file):
+    baselines = pd.DataFrame(
+        region_means(climatology, weights),
+        index=pd.Index(np.arange(1, 13), name="month"),
+        columns=pd.Index(regions, name="region")
+    ).stack().rename("baseline_k").reset_index()
+    monthly_df = pd.read_csv(monthly_file).merge(baselines, on=["month", "region"])
+    monthly_df["anomaly_c"] = monthly_df["temp_k"] - monthly_df["baseline_k"]
+    monthly_df["anomaly_f"] = monthly_df["anomaly_c"] * 9/5
+
+    output_file = "monthly_anomalies_regions.csv"
+    monthly_df[["year", "month", "region", "anomaly_c", "anomaly_f"]].to_csv(os.path.join(output_dir, output_file), index=False)
+    print(f"Saved data/output/{output_file}")
+
+if os.path.exists(seasonal_file):
+    seasonal_df = pd.read_csv(seasonal_file).set_index(["year", "region"])
+    baselines = pd.DataFrame(
+        region_means(np.stack([season_baselines[season] for season in seasonal_df.columns]), weights).T,
+        index=pd.Index(regions, name="region"),
+        columns=seasonal_df.columns
+    )
+    seasonal_df = seasonal_df.sub(baselines, level="region")
+
+    output_file = "seasonal_anomalies_regions.csv"
+    seasonal_df.reset_index().to_csv(os.path.join(output_dir, output_file), index=False)
+    print(f"Saved data/output/{output_file}")
+
+print("\n")
@@ -3,96 +3,135 @@ import json
 import numpy as np
 import xarray as xr
 from tqdm import tqdm
-from scipy.stats import linregress
 
-from CONFIG import start_year, end_year
-# list of years
-year_list = list(range(start_year, end_year + 1))
+from CONFIG import start_year, end_year, band_size, city_shard_size, export_city_json, record_percentiles
+from utils.seasons import open_seasonal_cube
+from utils.regression import linregress_batch
+from utils.records import WHOLE_STATS, record_stat_names, record_stats
+from utils.instrument import start_run
 
-# Define the path to the directory with annual temperature files
-annual_temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "output", "year")
+run = start_run(__file__)
 
 # Load city grid cells data
-city_grid_cells_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "output", "city_grid_cells.json")
+run.phase("load")
+dirname = os.path.dirname(os.path.abspath(__file__))
+city_grid_cells_file = os.path.join(dirname, "data", "output", "city_grid_cells.json")
 with open(city_grid_cells_file, "r") as f:
     city_grid_cells = json.load(f)
 
 # Load the original cities data
-cities_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "input", "cities.json")
+cities_file_path = os.path.join(dirname, "data", "input", "cities.json")
 with open(cities_file_path, "r") as f:
     cities = {city["id"]: city for city in json.load(f)}
 
 # Create the output directory if it doesn't exist
-city_output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "output", "city")
+city_output_dir = os.path.join(dirname, "data", "output", "city")
 os.makedirs(city_output_dir, exist_ok=True)
 
-# Function to calculate linear regression slope and intercept
-def calculate_slope_intercept(years, data):
-    if np.all(np.isnan(data)):
-        return np.nan, np.nan
-    slope, intercept, _, _, _ = linregress(years, data)
-    return slope, intercept
-
-# Dictionary to hold data for all cities
-city_data = {city["id"]: {"years": [], "summer": [], "winter": []} for city in city_grid_cells}
+# Open the seasonal temperatures for all years
+combined_ds = open_seasonal_cube(start_year, end_year)
+if combined_ds is None:
+    run.fail("No seasonal temperatures found, run annual-seasons.py first")
+seasons = list(combined_ds.data_vars)
 
-# Create a combined dataset for all years
-all_years_data = []
-
-for year in tqdm(range(start_year, end_year + 1), desc="Loading year files"):
-    year_file = os.path.join(annual_temp_dir, f"seasonal_temps_{year}.nc")
-    if not os.path.exists(year_file):
-        print(f"File for year {year} not found, skipping.")
+# list of years
+year_list = [int(year) for year in combined_ds.year.values]
+
+# Grid cell of every city
+lat_indexes = np.array([city["grid_lat_index"] for city in city_grid_cells], dtype=np.int64)
+lon_indexes = np.array([city["grid_lon_index"] for city in city_grid_cells], dtype=np.int64)
+
+# Gather every city's series with one fancy index per season and band of latitudes,
+# so only the bands that contain cities are read
+run.phase("extract", items=len(city_grid_cells), unit="cities")
+city_temps = {season: np.full((len(year_list), len(city_grid_cells)), np.nan) for season in seasons}
+n_lats = combined_ds.sizes["latitude"]
+for start in tqdm(range(0, n_lats, band_size), desc="Extracting cities"):
+    in_band = np.nonzero((lat_indexes >= start) & (lat_indexes < start + band_size))[0]
+    if len(in_band) == 0:
         continue
-
-    ds = xr.open_dataset(year_file)
-    all_years_data.append(ds)
-
-# Combine all datasets into one
-combined_ds = xr.concat(all_years_data, dim='year')
-
-# Iterate over each city and extract the seasonal temperatures
-for city in tqdm(city_grid_cells, desc="Processing cities"):
-    city_id = city["id"]
-    
-    lat_index = city["grid_lat_index"]
-    lon_index = city["grid_lon_index"]
-    lat = city["lat"]
-    lon = city["lon"]
-
-    # Extract all season data at once for the given latitude and longitude
-    seasonal_data = combined_ds[['summer', 'winter']].isel(latitude=lat_index, longitude=lon_index)
-    
-    # Convert to numpy arrays, then to python float
-    summer_temps = seasonal_data['summer'].values.astype(float)
-    winter_temps = seasonal_data['winter'].values.astype(float)
-
-    # Calculate slopes and intercepts for each season
-    summer_slope, summer_intercept = calculate_slope_intercept(year_list, summer_temps)
-    winter_slope, winter_intercept = calculate_slope_intercept(year_list, winter_temps)
-
-    # Structure the output data for the city
-    city_output_data = {
-        "id": city_id,
-        "name": cities[city_id]["name"],
-        "lat": lat,
-        "lon": lon,
-        "lat_index": lat_index,
-        "lon_index": lon_index,
-        "data": [{"year": y, "summer": s, "winter": w} for y, s, w in zip(year_list, summer_temps, winter_temps)],
-        "slopes": {
-            "summer": summer_slope,
-            "winter": winter_slope
-        },
-        "intercepts": {
-            "summer": summer_intercept,
-            "winter": winter_intercept
-        }
+    for season in seasons:
+        band = combined_ds[season].isel(latitude=slice(start, start + band_size)).values
+        city_temps[season][:, in_band] = band[:, lat_indexes[in_band] - start, lon_indexes[in_band]]
+
+# Fit every city's trend at once for each season
+run.phase("reduce", items=len(city_grid_cells), unit="cities")
+print("Calculating the slopes and intercepts")
+city_trends = {season: linregress_batch(year_list, city_temps[season]) for season in seasons}
+
+# Rank every city's years and find its records for each season, as make-records-netcdf.py does for the grid
+record_names = record_stat_names(record_percentiles)
+city_records = {season: record_stats(year_list, city_temps[season], record_percentiles) for season in seasons}
+
+# Save the series and trends as columns, in shards of up to city_shard_size cities
+run.phase("write shards", items=len(city_grid_cells), unit="cities")
+for shard, start in enumerate(range(0, len(city_grid_cells), city_shard_size)):
+    shard_cells = city_grid_cells[start:start + city_shard_size]
+    rows = slice(start, start + city_shard_size)
+    data_vars = {
+        "name": (["city"], np.array([cities[city["id"]]["name"] for city in shard_cells], dtype=object)),
+        "lat": (["city"], np.array([city["lat"] for city in shard_cells])),
+        "lon": (["city"], np.array([city["lon"] for city in shard_cells])),
+        "lat_index": (["city"], lat_indexes[rows]),
+        "lon_index": (["city"], lon_indexes[rows]),
     }
+    for season in seasons:
+        data_vars[season] = (["year", "city"], city_temps[season][:, rows])
+        data_vars[f"{season}_slope"] = (["city"], city_trends[season]["slope"][rows])
+        data_vars[f"{season}_intercept"] = (["city"], city_trends[season]["intercept"][rows])
+        data_vars[f"{season}_rank"] = (["year", "city"], city_records[season]["rank"][:, rows])
+        for stat in record_names:
+            data_vars[f"{season}_{stat}"] = (["city"], city_records[season][stat][rows])
+
+    shard_ds = xr.Dataset(
+        data_vars,
+        coords={
+            "city": np.array([str(city["id"]) for city in shard_cells], dtype=object),
+            "year": year_list
+        }
+    )
+    shard_file = os.path.join(city_output_dir, f"city_seasons_{shard:03d}.nc")
+    shard_ds.to_netcdf(shard_file, engine="netcdf4")
+    print(f"Saved data/output/city/{os.path.basename(shard_file)}")
+
+# Function to turn a record statistic into JSON, as a whole number where it is one and null where it is missing
+def to_record_value(stat, value):
+    if np.isnan(value):
+        return None
+    return int(value) if stat in WHOLE_STATS else float(value)
+
+# Optionally write one JSON file per city as well
+if export_city_json:
+    run.phase("write json", items=len(city_grid_cells), unit="cities")
+    for c, city in enumerate(tqdm(city_grid_cells, desc="Writing city files")):
+        city_id = city["id"]
+
+        # Structure the output data for the city
+        city_output_data = {
+            "id": city_id,
+            "name": cities[city_id]["name"],
+            "lat": city["lat"],
+            "lon": city["lon"],
+            "lat_index": city["grid_lat_index"],
+            "lon_index": city["grid_lon_index"],
+            "data": [
+                {"year": year, **{season: float(city_temps[season][y, c]) for season in seasons}}
+                for y, year in enumerate(year_list)
+            ],
+            "slopes": {season: float(city_trends[season]["slope"][c]) for season in seasons},
+            "intercepts": {season: float(city_trends[season]["intercept"][c]) for season in seasons},
+            "records": {
+                season: {
+                    "ranks": [to_record_value("rank", rank) for rank in city_records[season]["rank"][:, c]],
+                    **{stat: to_record_value(stat, city_records[season][stat][c]) for stat in record_names}
+                }
+                for season in seasons
+            }
+        }
 
-    # Output the results to a JSON file for the city
-    output_file_path = os.path.join(city_output_dir, f"{city_id}.json")
-    with open(output_file_path, "w") as f:
-        json.dump(city_output_data, f, indent=4)
+        # Output the results to a JSON file for the city
+        output_file_path = os.path.join(city_output_dir, f"{city_id}.json")
+        with open(output_file_path, "w") as f:
+            json.dump(city_output_data, f, indent=4)
 
 print("City seasonal temperatures extraction and slope/intercept calculation complete.\n\n")
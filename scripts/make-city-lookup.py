@@ -1,61 +1,62 @@
 import os
 import json
 import numpy as np
-import xarray as xr
-from scipy.spatial import cKDTree
-from tqdm import tqdm
 
-from CONFIG import file_name, engine
+from utils.store import open_input
+from utils.grid_index import load_grid_index, query_grid_index, outside_grid
+from utils.instrument import start_run
 
-# Open the GRIB2 file using xarray
-dirname = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(dirname, "data", "input", file_name)
-ds = xr.open_dataset(file_path, engine=engine)
+run = start_run(__file__)
 
-# Adjust longitudes to be in the range -180 to 180
-ds = ds.assign_coords(longitude=(((ds.longitude + 180) % 360) - 180)).sortby("longitude")
+# Open the ERA5 store, which already has longitudes in the range -180 to 180
+run.phase("load")
+dirname = os.path.dirname(os.path.abspath(__file__))
+ds = open_input()
 
 # Extract latitude and longitude arrays
 lats = ds["latitude"].values
 lons = ds["longitude"].values
 
-# Create a meshgrid of latitude and longitude
-lon_grid, lat_grid = np.meshgrid(lons, lats)
-
-# Flatten the latitude and longitude arrays to create points for KDTree
-points = np.vstack([lat_grid.ravel(), lon_grid.ravel()]).T
-
-# Build a KDTree for fast spatial indexing
-tree = cKDTree(points)
-
-# Function to find the nearest grid cell for a given latitude and longitude
-def find_nearest_grid_cell(lat, lon):
-    distance, index = tree.query([lat, lon])
-    lat_index, lon_index = np.unravel_index(index, lat_grid.shape)
-    return distance, index, lat_index, lon_index
+# Load the spatial index of the grid, building it the first time
+run.phase("grid index", items=len(lats) * len(lons))
+index = load_grid_index(lats, lons)
 
 # Load cities data from JSON file
+run.phase("load cities")
 cities_file_path = os.path.join(dirname, "data", "input", "cities.json")
 with open(cities_file_path, "r") as f:
     cities = json.load(f)
 
-# Find the grid cell for each city with progress indication
-city_grid_cells = []
-for city in tqdm(cities, desc="Processing cities"):
-    lat = float(city["lat"])
-    lon = float(city["lon"])
-    distance, index, lat_index, lon_index = find_nearest_grid_cell(lat, lon)
-    city_grid_cells.append({
+# Find the grid cell for every city in one batch
+run.phase("query", items=len(cities), unit="cities")
+print(f"Finding the grid cells of {len(cities)} cities")
+city_lats = np.array([float(city["lat"]) for city in cities])
+city_lons = np.array([float(city["lon"]) for city in cities])
+outside = outside_grid(index, city_lats, city_lons)
+if outside.any():
+    bad = [str(city["id"]) for city, bad in zip(cities, outside) if bad]
+    run.fail(f"{len(bad)} cities have coordinates outside the grid: {', '.join(bad)}")
+lat_indexes, lon_indexes, distances = query_grid_index(index, city_lats, city_lons)
+
+# The distance in degrees to the cell center, as this file has always had, next to the distance in km
+degrees = np.hypot(city_lats - lats[lat_indexes], (city_lons - lons[lon_indexes] + 180) % 360 - 180)
+
+city_grid_cells = [
+    {
         "id": city["id"],
-        "lat": lat,
-        "lon": lon,
-        "grid_distance": distance,
-        "grid_index": index,
+        "lat": float(lat),
+        "lon": float(lon),
+        "grid_distance": float(degree_distance),
+        "grid_distance_km": float(distance),
+        "grid_index": int(lat_index * len(lons) + lon_index),
         "grid_lat_index": int(lat_index),
         "grid_lon_index": int(lon_index)
-    })
+    }
+    for city, lat, lon, degree_distance, distance, lat_index, lon_index in zip(cities, city_lats, city_lons, degrees, distances, lat_indexes, lon_indexes)
+]
 
 # Output the results
+run.phase("write", items=len(cities), unit="cities")
 output_file_path = os.path.join(dirname, "data", "output", "city_grid_cells.json")
 os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 with open(output_file_path, "w") as f:
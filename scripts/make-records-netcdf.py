@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import xarray as xr
+from tqdm import tqdm
+
+from CONFIG import start_year, end_year, band_size, use_dask, use_processes, record_percentiles
+from utils.records import WHOLE_STATS, record_stat_names, record_stats
+from utils.compute import chunk_along
+from utils.parallel import SharedArrays, map_bands
+from utils.seasons import open_seasonal_cube, cube_encoding
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+print("Ranking the years and finding the records of every season in each grid cell.")
+
+# Define the output file
+dirname = os.path.dirname(os.path.abspath(__file__))
+output_file_name = f"seasonal_records_{start_year}_{end_year}.nc"
+output_file = os.path.join(dirname, "data", "output", output_file_name)
+
+# Open the seasonal temperatures for all years
+run.phase("load")
+combined_ds = open_seasonal_cube(start_year, end_year)
+if combined_ds is None:
+    run.fail("No seasonal temperatures found, run annual-seasons.py first")
+loaded_years = combined_ds.year.values
+seasons = list(combined_ds.data_vars)
+
+lats = combined_ds.latitude.values
+lons = combined_ds.longitude.values
+
+# The statistics saved for each season besides the ranks
+output_stats = record_stat_names(record_percentiles)
+
+# Function to rank one latitude band of a season, with the rank of every year followed by
+# the statistics stacked along the first axis
+def records_band(temps):
+    results = record_stats(loaded_years, temps, record_percentiles)
+    return np.concatenate([results["rank"], np.stack([results[stat] for stat in output_stats])])
+
+# Function to rank one band of the shared temperatures into the shared results, in a worker process
+def records_task(band, arrays):
+    arrays["results"][:, band] = records_band(arrays["temps"][:, band])
+
+# Rank every grid cell for each season, a band of latitudes at a time so the sort fits in memory
+run.phase("reduce", items=sum(combined_ds[season].size for season in seasons))
+n_results = len(loaded_years) + len(output_stats)
+data_vars = {}
+for season in seasons:
+    if use_dask:
+        # Lazily, computed in parallel when saving
+        temps = chunk_along(combined_ds[season], "latitude").data
+        results = temps.map_blocks(records_band, chunks=((n_results,),) + temps.chunks[1:], dtype=np.float64)
+    elif use_processes:
+        # On a pool of worker processes, with the temperatures and the results in shared memory
+        print(f"Ranking {season}")
+        with SharedArrays() as shared:
+            shared.load("temps", combined_ds[season])
+            shared.empty("results", (n_results, len(lats), len(lons)))
+            map_bands(records_task, len(lats), shared.arrays)
+            results = shared["results"].copy()
+    else:
+        results = np.full((n_results, len(lats), len(lons)), np.nan)
+        for start in tqdm(range(0, len(lats), band_size), desc=f"Ranking {season}"):
+            band = slice(start, start + band_size)
+            results[:, band] = records_band(combined_ds[season].isel(latitude=band).values)
+
+    data_vars[f"{season}_rank"] = (["year", "latitude", "longitude"], results[:len(loaded_years)])
+    for stat, values in zip(output_stats, results[len(loaded_years):]):
+        data_vars[f"{season}_{stat}"] = (["latitude", "longitude"], values)
+
+# Create a new dataset with the ranks and records
+records_ds = xr.Dataset(
+    data_vars,
+    coords={
+        "year": loaded_years,
+        "latitude": lats,
+        "longitude": lons
+    }
+)
+
+# Ranks, years and counts are whole numbers, so store them as int16, with -1 marking a missing
+# value. The ranks of each cell are chunked like the seasonal temperatures.
+encoding = {}
+for season in seasons:
+    for stat in WHOLE_STATS:
+        encoding[f"{season}_{stat}"] = {"dtype": "int16", "_FillValue": -1}
+    rank = f"{season}_rank"
+    encoding[rank] = {**cube_encoding(records_ds[[rank]])[rank], **encoding[rank]}
+
+# Save the records to a NetCDF file (with dask, the ranking runs while saving), through a
+# temporary file so a run that is killed never leaves a file that looks complete
+run.phase("write", items=len(lats) * len(lons))
+os.makedirs(os.path.dirname(output_file), exist_ok=True)
+records_ds.to_netcdf(f"{output_file}.tmp", engine="netcdf4", encoding=encoding)
+os.replace(f"{output_file}.tmp", output_file)
+
+# Print confirmation message
+print(f"Saved {output_file_name}\n\n")
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from CONFIG import start_year, end_year
+from utils.store import open_input
+from utils.seasons import open_seasonal_cube
+from utils.region_masks import load_region_weights, region_means
+from utils.instrument import start_run
+monthly_start_year = 1940
+
+run = start_run(__file__)
+print("Averaging monthly and seasonal temperatures for every country and region...")
+
+# Function to convert Kelvin to Fahrenheit
+def kelvin_to_fahrenheit(kelvin):
+    return (kelvin - 273.15) * 9/5 + 32
+
+# Function to convert Kelvin to Celsius
+def kelvin_to_celsius(kelvin):
+    return kelvin - 273.15
+
+# Open the ERA5 store
+run.phase("load")
+dirname = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(dirname, "data", "output")
+ds = open_input()
+
+# Filter the dataset for the required years
+ds = ds.sel(time=slice(f"{monthly_start_year}-01-01", f"{end_year}-12-31"))
+
+# Load the region weights, rasterizing the regions onto the grid if they are not cached yet
+run.phase("region weights")
+regions, weights = load_region_weights(ds.latitude.values, ds.longitude.values)
+
+# Calculate the mean of every region in every month, one year of months at a time
+run.phase("reduce monthly", items=ds["t2m"].size)
+monthly_means = np.concatenate([
+    region_means(ds["t2m"].isel(time=slice(start, start + 12)).values, weights)
+    for start in tqdm(range(0, ds.sizes["time"], 12), desc="Averaging months")
+])
+times = pd.DatetimeIndex(ds.time.values)
+monthly = pd.DataFrame(monthly_means, columns=pd.Index(regions, name="region"))
+monthly["year"] = times.year
+monthly["month"] = times.month
+monthly_df = monthly.set_index(["year", "month"]).stack().rename("temp_k").reset_index()
+monthly_df["temp_f"] = monthly_df["temp_k"].apply(kelvin_to_fahrenheit)
+monthly_df["temp_c"] = monthly_df["temp_k"].apply(kelvin_to_celsius)
+
+run.phase("write monthly", items=len(monthly_df), unit="rows")
+output_file = "monthly_mean_temperatures_regions.csv"
+os.makedirs(output_dir, exist_ok=True)
+monthly_df.to_csv(os.path.join(output_dir, output_file), index=False)
+print(f"Saved data/output/{output_file}")
+
+# Calculate the mean of every region in every season from the seasonal temperatures, if they exist
+seasonal_ds = open_seasonal_cube(start_year, end_year)
+if seasonal_ds is not None:
+    seasons = list(seasonal_ds.data_vars)
+    run.phase("reduce seasonal", items=sum(seasonal_ds[season].size for season in seasons))
+    seasonal_df = pd.concat([
+        pd.DataFrame(
+            region_means(seasonal_ds[season].values, weights),
+            index=pd.Index(seasonal_ds.year.values, name="year"),
+            columns=pd.Index(regions, name="region")
+        ).stack().rename(season)
+        for season in seasons
+    ], axis=1).reset_index()
+
+    run.phase("write seasonal", items=len(seasonal_df), unit="rows")
+    output_file = "seasonal_mean_temperatures_regions.csv"
+    seasonal_df.to_csv(os.path.join(output_dir, output_file), index=False)
+    print(f"Saved data/output/{output_file}")
+
+print("\n")
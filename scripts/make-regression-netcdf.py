@@ -2,78 +2,168 @@ import os
 import numpy as np
 import xarray as xr
 from tqdm import tqdm
-from scipy.stats import linregress
 
-from CONFIG import start_year, end_year
+from CONFIG import start_year, end_year, band_size, use_dask, use_processes, use_checkpoints, tile_size, robust_trends
+from CONFIG import bootstrap_resamples, bootstrap_block_length, bootstrap_confidence, bootstrap_seed
+from utils.regression import STATS, linregress_batch
+from utils.robust import ROBUST_STATS, robust_trends_batch
+from utils.bootstrap import BOOTSTRAP_STATS, block_bootstrap_counts, bootstrap_slope_ci
+from utils.compute import chunk_along
+from utils.parallel import SharedArrays, map_bands
+from utils.seasons import output_dir, year_dir, open_seasonal_cube
+from utils.checkpoint import Checkpoint, file_fingerprint
+from utils.tiles import TiledWriter, grid_tiles, map_tiles
+from utils.instrument import start_run
 
-print("Calculating the linear regression slopes of year vs. temperature for summer and winter in each grid cell.")
+run = start_run(__file__)
 
-# Define the directory for the yearly files
+print("Calculating the linear regression slopes of year vs. temperature for every season in each grid cell.")
+
+# Define the output file
 dirname = os.path.dirname(os.path.abspath(__file__))
-input_dir = os.path.join(dirname, "data", "output", "year")
 output_file_name = f"seasonal_slopes_{start_year}_{end_year}.nc"
 output_file = os.path.join(dirname, "data", "output", output_file_name)
 
-# Create a years range
-years = range(start_year, end_year + 1)
-
-# Create a combined dataset for all years
-all_years_data = []
-
-for year in tqdm(years, desc="Loading year files"):
-    year_file = os.path.join(input_dir, f"seasonal_temps_{year}.nc")
-    if not os.path.exists(year_file):
-        print(f"File for year {year} not found, skipping.")
-        continue
+# Open the seasonal temperatures for all years
+run.phase("load")
+combined_ds = open_seasonal_cube(start_year, end_year)
+if combined_ds is None:
+    run.fail("No seasonal temperatures found, run annual-seasons.py first")
+loaded_years = combined_ds.year.values
+seasons = list(combined_ds.data_vars)
 
-    ds = xr.open_dataset(year_file, engine="netcdf4")
-    all_years_data.append(ds)
-
-# Combine all datasets into one
-combined_ds = xr.concat(all_years_data, dim='year')
-
-# Initialize arrays to store slopes for summer and winter
 lats = combined_ds.latitude.values
 lons = combined_ds.longitude.values
 
-summer_slopes = np.full((len(lats), len(lons)), np.nan)
-winter_slopes = np.full((len(lats), len(lons)), np.nan)
-
-# A function for calculating the regression
-def calculate_regression(temps, array, i, j):
-    if np.count_nonzero(~np.isnan(temps)) >= 2:
-        slope, _, _, _, _ = linregress(years, temps)
-        array[i, j] = slope
-
-# Loop through each grid cell to calculate the linear regression slopes
-for i in tqdm(range(len(lats)), desc="Processing cells", unit="cell"):
-    for j in range(len(lons)):
-        # Extract all season data at once for the given latitude and longitude
-        seasonal_data = combined_ds[['summer', 'winter']].isel(latitude=i, longitude=j)
-        
-        # Convert to numpy arrays, then to python float
-        summer_temps = seasonal_data['summer'].values.astype(float)
-        winter_temps = seasonal_data['winter'].values.astype(float)
-
-        # Perform linear regression if there are enough valid data points
-        calculate_regression(summer_temps, summer_slopes, i, j)
-        calculate_regression(winter_temps, winter_slopes, i, j)
-
-# Create a new dataset with the calculated slopes
-slope_ds = xr.Dataset(
-    {
-        "summer_slope": (["latitude", "longitude"], summer_slopes),
-        "winter_slope": (["latitude", "longitude"], winter_slopes),
-    },
-    coords={
-        "latitude": lats,
-        "longitude": lons
-    }
-)
-
-# Save the slope data to a NetCDF file
+# The statistics saved for each season, optionally with the Theil–Sen slope and Mann–Kendall test
+# and the bootstrap confidence interval of the slope
+output_stats = STATS + (ROBUST_STATS if robust_trends else []) + (BOOTSTRAP_STATS if bootstrap_resamples else [])
+
+# Draw the bootstrap resamples of the years once, to be shared by every cell and season
+if bootstrap_resamples:
+    resample_counts = block_bootstrap_counts(len(loaded_years), bootstrap_resamples, bootstrap_block_length, bootstrap_seed)
+
+# Function to fit one latitude band of a season, with the statistics stacked along the first axis
+def regress_band(temps):
+    results = linregress_batch(loaded_years, temps)
+    if robust_trends:
+        results.update(robust_trends_batch(loaded_years, temps))
+    if bootstrap_resamples:
+        results.update(bootstrap_slope_ci(loaded_years, temps, resample_counts, bootstrap_confidence))
+    return np.stack([results[stat] for stat in output_stats])
+
+# Function to fit one band of the shared temperatures into the shared statistics, in a worker process
+def regress_task(band, arrays):
+    arrays["results"][:, band] = regress_band(arrays["temps"][:, band])
+
+# Checkpoint every band or tile of each season as it finishes, so a run that is killed can resume from
+# the same seasonal temperatures and settings
+checkpoint = None
+if use_checkpoints and (tile_size or not use_dask):
+    seasonal_files = [os.path.join(output_dir, f"seasonal_temps_{start_year}_{end_year}.nc")] + [
+        os.path.join(year_dir, f"seasonal_temps_{year}.nc") for year in range(start_year, end_year + 1)
+    ]
+    checkpoint = Checkpoint(run.stage, {
+        "input": file_fingerprint(seasonal_files),
+        "years": loaded_years.tolist(),
+        "stats": output_stats,
+        "bootstrap": [bootstrap_resamples, bootstrap_block_length, bootstrap_confidence, bootstrap_seed],
+    })
+
+# Function to fill a band of a season's statistics from its checkpoint, returning whether there was one
+def restore_band(season, band, results):
+    saved = checkpoint.load(f"{season} rows {band.start}-{band.stop}") if checkpoint else None
+    if saved is None:
+        return False
+    results[:, band] = saved["results"]
+    return True
+
+# Function to checkpoint a finished band of a season's statistics
+def save_band(season, band, results):
+    if checkpoint:
+        checkpoint.save(f"{season} rows {band.start}-{band.stop}", results=results[:, band])
+
+# Function to load a tile of a season's statistics from its checkpoint, or None if it has none
+def restore_tile(season, tile):
+    saved = checkpoint.load(f"{season} {tile}") if checkpoint else None
+    return None if saved is None else saved["results"]
+
+# Function to checkpoint a finished tile of a season's statistics and write it to the output file
+def write_tile(season, tile, results):
+    if checkpoint:
+        checkpoint.save(f"{season} {tile}", results=results)
+    for stat, values in zip(output_stats, results):
+        writer.write(f"{season}_{stat}", tile, values)
+
+# Fit every grid cell at once for each season. Cells need at least 2 valid years,
+# and missing years are masked per cell.
+run.phase("reduce", items=sum(combined_ds[season].size for season in seasons))
 os.makedirs(os.path.dirname(output_file), exist_ok=True)
-slope_ds.to_netcdf(output_file, engine="netcdf4")
+data_vars = {}
+if tile_size:
+    writer = TiledWriter(
+        output_file,
+        {"latitude": lats, "longitude": lons},
+        {f"{season}_{stat}": ("latitude", "longitude") for season in seasons for stat in output_stats}
+    )
+for season in seasons:
+    if tile_size:
+        # A tile at a time on a pool of threads, written straight into the output file, so the
+        # whole grid is never in memory
+        map_tiles(
+            grid_tiles(len(lats), len(lons), tile_size),
+            read=lambda tile: combined_ds[season].isel(latitude=tile.read_rows, longitude=tile.read_cols).values,
+            compute=lambda tile, temps: tile.trim(regress_band(temps)),
+            write=lambda tile, results: write_tile(season, tile, results),
+            restore=lambda tile: restore_tile(season, tile),
+            desc=f"Calculating {season} regressions"
+        )
+        continue
+    elif use_dask:
+        # Lazily, a band of latitudes at a time, computed in parallel when saving
+        temps = chunk_along(combined_ds[season], "latitude").data
+        results = temps.map_blocks(regress_band, chunks=((len(output_stats),),) + temps.chunks[1:], dtype=np.float64)
+    elif use_processes:
+        # On a pool of worker processes, with the temperatures and the statistics in shared memory
+        print(f"Calculating {season} regressions")
+        with SharedArrays() as shared:
+            shared.load("temps", combined_ds[season])
+            results = shared.empty("results", (len(output_stats), len(lats), len(lons)))
+            map_bands(
+                regress_task, len(lats), shared.arrays,
+                restore=lambda band: restore_band(season, band, results),
+                save=lambda band: save_band(season, band, results)
+            )
+            results = results.copy()
+    else:
+        results = np.full((len(output_stats), len(lats), len(lons)), np.nan)
+        for start in tqdm(range(0, len(lats), band_size), desc=f"Calculating {season} regressions"):
+            band = slice(start, start + band_size)
+            if not restore_band(season, band, results):
+                results[:, band] = regress_band(combined_ds[season].isel(latitude=band).values)
+                save_band(season, band, results)
+    for stat, values in zip(output_stats, results):
+        data_vars[f"{season}_{stat}"] = (["latitude", "longitude"], values)
+
+run.phase("write", items=len(lats) * len(lons))
+if tile_size:
+    writer.close()
+else:
+    # Create a new dataset with the calculated slopes and regression statistics
+    slope_ds = xr.Dataset(
+        data_vars,
+        coords={
+            "latitude": lats,
+            "longitude": lons
+        }
+    )
+
+    # Save the slope data to a NetCDF file (with dask, the regressions run while saving), through
+    # a temporary file so a run that is killed never leaves a file that looks complete
+    slope_ds.to_netcdf(f"{output_file}.tmp", engine="netcdf4")
+    os.replace(f"{output_file}.tmp", output_file)
+if checkpoint:
+    checkpoint.clear()
 
 # Print confirmation message
 print(f"Saved {output_file_name}\n\n")
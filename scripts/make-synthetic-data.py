@@ -0,0 +1,35 @@
+import os
+import argparse
+
+from CONFIG import start_year, end_year, engine, file_name
+from utils.synthetic import write_synthetic, write_synthetic_cities
+
+# Write synthetic ERA5-like input in place of the Copernicus download, so every stage can be run
+# without it. The defaults cover the years in CONFIG, including the year before for December.
+parser = argparse.ArgumentParser(description="Write synthetic monthly 2m temperature data in the ERA5 layout")
+parser.add_argument("--start-year", type=int, default=start_year - 1)
+parser.add_argument("--end-year", type=int, default=end_year)
+parser.add_argument("--resolution", type=float, default=1.0, help="grid spacing in degrees (ERA5 is 0.25)")
+parser.add_argument("--cities", type=int, default=100, help="number of random cities to write to cities.json")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--force", action="store_true", help="overwrite existing input files")
+args = parser.parse_args()
+
+# Define the file paths
+dirname = os.path.dirname(os.path.abspath(__file__))
+input_dir = os.path.join(dirname, "data", "input")
+input_path = os.path.join(input_dir, file_name)
+cities_path = os.path.join(input_dir, "cities.json")
+
+for path in [input_path] + ([cities_path] if args.cities else []):
+    if os.path.exists(path) and not args.force:
+        raise SystemExit(f"{os.path.relpath(path, dirname)} already exists, use --force to overwrite it")
+
+print(f"Writing synthetic data for {args.start_year}-{args.end_year} at {args.resolution}° to {file_name}")
+os.makedirs(input_dir, exist_ok=True)
+write_synthetic(input_path, args.start_year, args.end_year, args.resolution, engine, args.seed)
+print(f"Saved data/input/{file_name}")
+
+if args.cities:
+    write_synthetic_cities(cities_path, args.cities, args.seed)
+    print(f"Saved {args.cities} cities to data/input/cities.json")
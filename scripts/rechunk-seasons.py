@@ -0,0 +1,29 @@
+import os
+
+from CONFIG import start_year, end_year, band_size, cube_layout, cube_chunk
+from utils.seasons import output_dir, open_seasonal_cube, cube_encoding
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+print(f"Rewriting the seasonal temperatures for {start_year}-{end_year} in the {cube_layout} layout")
+
+# Open the seasonal temperatures, from the cube or else from the per-year files
+run.phase("load")
+cube_file = os.path.join(output_dir, f"seasonal_temps_{start_year}_{end_year}.nc")
+ds = open_seasonal_cube(start_year, end_year)
+if ds is None:
+    run.fail("No seasonal temperatures found, run annual-seasons.py first")
+
+# Copy bands of whole latitude rows at a time into the new layout, in multiples of the chunk
+# size so that every chunk of the new file is written once
+rows = max(cube_chunk, band_size // cube_chunk * cube_chunk)
+ds = ds.chunk({"year": -1, "latitude": rows, "longitude": -1})
+
+# Save to a temporary file and only replace the cube once it is complete
+run.phase("write", items=sum(ds[season].size for season in ds.data_vars))
+temp_file = f"{cube_file}.tmp"
+ds.to_netcdf(temp_file, engine="netcdf4", encoding=cube_encoding(ds))
+ds.close()
+os.replace(temp_file, cube_file)
+print(f"Saved data/output/{os.path.basename(cube_file)} ({os.path.getsize(cube_file) / 2 ** 20:.1f} MB)")
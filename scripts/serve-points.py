@@ -0,0 +1,174 @@
+import os
+import json
+import threading
+import traceback
+import numpy as np
+import xarray as xr
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from CONFIG import start_year, end_year, service_host, service_port, service_cache_size
+from utils.seasons import open_seasonal_cube, year_dir
+from utils.grid_index import load_grid_index, query_grid_index, outside_grid
+from utils.flat_binary import open_flat
+from utils.records import WHOLE_STATS
+
+# Open the seasonal temperatures and the slopes. The flat binary export of the temperatures
+# (scripts/export-flat.py) is memory-mapped when it exists and is not older than the NetCDF
+# seasonal temperatures; otherwise the NetCDF files are opened lazily. The slopes always come from the NetCDF file, because the flat export only has
+# the variables draw-rasters.js maps. Either way only the requested cells are read.
+dirname = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(dirname, "data", "output")
+temps_flat_file = os.path.join(output_dir, f"seasonal_temps_{start_year}_{end_year}.bin")
+
+# Function to check whether the flat export exists and is at least as new as the NetCDF
+# seasonal temperatures it was exported from, the stacked cube or the per-year files
+def flat_is_current():
+    if not os.path.exists(temps_flat_file):
+        return False
+    sources = [os.path.join(output_dir, f"seasonal_temps_{start_year}_{end_year}.nc")] + [
+        os.path.join(year_dir, f"seasonal_temps_{year}.nc") for year in range(start_year, end_year + 1)
+    ]
+    flat_mtime = os.path.getmtime(temps_flat_file)
+    stale = [path for path in sources if os.path.exists(path) and os.path.getmtime(path) > flat_mtime]
+    if stale:
+        print(f"{os.path.basename(temps_flat_file)} is older than {os.path.basename(stale[0])}, reading the NetCDF seasonal temperatures instead")
+    return not stale
+
+if flat_is_current():
+    header, temp_arrays = open_flat(temps_flat_file)
+    years = [int(year) for year in header["coords"]["year"]]
+    lats = np.array(header["coords"]["latitude"])
+    lons = np.array(header["coords"]["longitude"])
+else:
+    seasonal_ds = open_seasonal_cube(start_year, end_year)
+    if seasonal_ds is None:
+        raise SystemExit("No seasonal temperatures found, run annual-seasons.py first")
+    temp_arrays = {season: seasonal_ds[season] for season in seasonal_ds.data_vars}
+    years = [int(year) for year in seasonal_ds.year.values]
+    lats = seasonal_ds.latitude.values
+    lons = seasonal_ds.longitude.values
+
+slopes_ds = xr.open_dataset(os.path.join(output_dir, f"seasonal_slopes_{start_year}_{end_year}.nc"), engine="netcdf4")
+slope_arrays = {name: slopes_ds[name] for name in slopes_ds.data_vars}
+
+seasons = list(temp_arrays)
+index = load_grid_index(lats, lons)
+
+# Open the ranks and records of every cell (scripts/make-records-netcdf.py) lazily, if they exist
+records_file = os.path.join(output_dir, f"seasonal_records_{start_year}_{end_year}.nc")
+record_arrays = {}
+if os.path.exists(records_file):
+    records_ds = xr.open_dataset(records_file, engine="netcdf4")
+    record_arrays = {name: records_ds[name] for name in records_ds.data_vars}
+
+# The NetCDF library is not thread safe, so reads go one at a time
+read_lock = threading.Lock()
+
+# Function to turn NaN into null for JSON
+def to_json_value(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+# Function to turn the records of a cell into JSON, with the ranks of every year as a list and
+# whole numbers as integers
+def to_record_value(name, values):
+    if values.ndim:
+        return [to_record_value(name, value) for value in values]
+    value = to_json_value(values)
+    whole = any(name.endswith(f"_{stat}") for stat in WHOLE_STATS)
+    return int(value) if whole and value is not None else value
+
+# Function to read the series and trend statistics of one grid cell, keeping the most
+# recently used cells in memory
+@lru_cache(maxsize=service_cache_size)
+def read_cell(lat_index, lon_index):
+    with read_lock:
+        series = {season: np.asarray(temp_arrays[season][:, lat_index, lon_index]) for season in seasons}
+        stats = {name: np.asarray(values[lat_index, lon_index]) for name, values in slope_arrays.items()}
+        records = {name: np.asarray(values[..., lat_index, lon_index]) for name, values in record_arrays.items()}
+    cell = {
+        "years": years,
+        **{season: [to_json_value(value) for value in series[season]] for season in seasons},
+        "trends": {name: to_json_value(value) for name, value in stats.items()}
+    }
+    if records:
+        cell["records"] = {name: to_record_value(name, values) for name, values in records.items()}
+    return cell
+
+# Function to answer a batch of coordinates, resolving them all to grid cells at once
+def query_points(points):
+    point_lats = np.array([float(lat) for lat, _ in points])
+    point_lons = np.array([float(lon) for _, lon in points])
+    outside = outside_grid(index, point_lats, point_lons)
+    if outside.any():
+        bad = ", ".join(f"{lat},{lon}" for lat, lon in zip(point_lats[outside], point_lons[outside]))
+        raise ValueError(f"coordinates outside the grid: {bad}")
+    lat_indexes, lon_indexes, distances = query_grid_index(index, point_lats, point_lons)
+    return [
+        {
+            "lat": float(lat),
+            "lon": float(lon),
+            "lat_index": int(lat_index),
+            "lon_index": int(lon_index),
+            "grid_lat": float(lats[lat_index]),
+            "grid_lon": float(lons[lon_index]),
+            "grid_distance_km": float(distance),
+            **read_cell(int(lat_index), int(lon_index))
+        }
+        for lat, lon, lat_index, lon_index, distance in zip(point_lats, point_lons, lat_indexes, lon_indexes, distances)
+    ]
+
+# Request handler:
+#   GET  /point?lat=40.71&lon=-74.01             one point
+#   GET  /points?coords=40.71,-74.01;51.5,-0.12  a batch of points
+#   POST /points with [{"lat": 40.71, "lon": -74.01}, ...]
+class PointHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # Function to log an unexpected error and still answer the request, so the client isn't left
+    # with a dropped connection
+    def send_server_error(self, error):
+        traceback.print_exc()
+        self.send_json(500, {"error": f"Internal error: {error}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        try:
+            if url.path == "/point":
+                self.send_json(200, query_points([(params["lat"][0], params["lon"][0])])[0])
+            elif url.path == "/points":
+                points = [pair.split(",") for pair in params["coords"][0].split(";") if pair]
+                self.send_json(200, query_points(points))
+            else:
+                self.send_json(404, {"error": f"Unknown path {url.path}"})
+        except (KeyError, ValueError) as e:
+            self.send_json(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            self.send_server_error(e)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/points":
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+            self.send_json(200, query_points([(point["lat"], point["lon"]) for point in body]))
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            self.send_server_error(e)
+
+server = ThreadingHTTPServer((service_host, service_port), PointHandler)
+print(f"Serving seasonal temperatures for {start_year}-{end_year} at http://{service_host}:{service_port}")
+server.serve_forever()
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+import xarray as xr
+from tqdm import tqdm
+
+from CONFIG import start_year, band_size
+from utils.store import open_input, open_raw
+from utils.regression import STATS, linregress_from_sums
+from utils.seasons import HEMISPHERES, SEASONS, compose_seasons, kelvin_to_fahrenheit, season_end, cube_dtype
+from utils.instrument import start_run
+
+run = start_run(__file__)
+
+print("Updating the seasonal regressions with the newest ERA5 months.")
+
+# Define the file paths
+dirname = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(dirname, "data", "output")
+state_file = os.path.join(output_dir, "incremental_state.npz")
+
+# Running sums kept for every season and grid cell, with x = year - start_year
+SUMS = ["n", "sx", "sy", "sxy", "sxx", "syy"]
+
+# Months kept between updates, enough to finish any season that is still in progress
+WINDOW = 11
+
+# Months composed at a time when the state is first built from the full history
+HISTORY_BLOCK = 120
+
+# Function to start an empty state for the grid, before any month has been processed
+def new_state(lats, lons):
+    shape = (len(SEASONS), len(lats), len(lons))
+    state = {name: np.zeros(shape) for name in SUMS}
+    state.update({
+        "seasons": json.dumps(SEASONS),
+        "start_year": start_year,
+        "latitude": lats,
+        "longitude": lons,
+        "last_time": np.datetime64(f"{start_year - 1}-01-01", "ns") - np.timedelta64(1, "D"),
+        "window": np.zeros((0, len(lats), len(lons)), dtype=np.float32),
+        "window_times": np.array([], dtype="datetime64[ns]"),
+        "latest": np.full(shape, np.nan),
+        "latest_year": np.zeros((len(SEASONS), len(HEMISPHERES)), dtype=int),
+    })
+    return state
+
+# Function to load the saved state, or None if there is none or it was built with
+# different seasons, start year or grid
+def load_state(lats, lons):
+    if not os.path.exists(state_file):
+        return None
+    with np.load(state_file) as saved:
+        state = {name: saved[name] for name in saved.files}
+    state["seasons"] = str(state["seasons"])
+    state["start_year"] = int(state["start_year"])
+    state["last_time"] = state["last_time"][()]
+    if (
+        state["seasons"] != json.dumps(SEASONS)
+        or state["start_year"] != start_year
+        or not np.array_equal(state["latitude"], lats)
+        or not np.array_equal(state["longitude"], lons)
+    ):
+        print("The saved state does not match CONFIG, rebuilding it from the full history")
+        return None
+    return state
+
+# Function to save the state, only replacing the old one once it is complete
+def save_state(state):
+    os.makedirs(output_dir, exist_ok=True)
+    temp_file = f"{state_file}.tmp"
+    with open(temp_file, "wb") as f:
+        np.savez(f, **state)
+    os.replace(temp_file, state_file)
+
+# Function to find which (season, hemisphere, year) seasons have their last month after
+# the previous update and up to the newest month, so each one is only ever added once
+def fresh_seasons(years, previous, newest):
+    fresh = np.zeros((len(SEASONS), len(HEMISPHERES), len(years)), dtype=bool)
+    for s, season in enumerate(SEASONS):
+        for h, hemisphere in enumerate(HEMISPHERES):
+            ends = np.array([season_end(season, hemisphere, year) for year in years])
+            fresh[s, h] = (ends > previous) & (ends <= newest) & (years >= start_year)
+    return fresh
+
+# Function to add a block of new months to the state: finish every season that the new
+# months complete, add those seasons to the running sums, and keep the last months
+def update(state, t2m):
+    times = np.concatenate([state["window_times"], t2m.time.values])
+    years = np.arange(pd.DatetimeIndex(times).year.min() - 1, pd.DatetimeIndex(times).year.max() + 2)
+    fresh = fresh_seasons(years, state["last_time"], times[-1])
+    lats = state["latitude"]
+
+    window = np.empty((min(WINDOW, len(times)), len(lats), len(state["longitude"])), dtype=np.float32)
+    for start in range(0, len(lats), band_size):
+        band = slice(start, start + band_size)
+        monthly = np.concatenate([state["window"][:, band], t2m.isel(latitude=band).values])
+        window[:, band] = monthly[len(monthly) - len(window):]
+        if not fresh.any():
+            continue
+
+        # Rounded to the type annual-seasons.py stores, so the fits match a full recompute
+        seasonal = kelvin_to_fahrenheit(compose_seasons(monthly.astype(np.float64), times, lats[band], years))
+        seasonal = seasonal.astype(cube_dtype).astype(np.float64)
+        for s, h, y in zip(*np.nonzero(fresh)):
+            rows = (lats[band] >= 0) if h == 0 else (lats[band] < 0)
+            values = seasonal[s, y, rows]
+            valid = ~np.isnan(values)
+            x = years[y] - start_year
+            v = np.where(valid, values, 0)
+            for name, term in zip(SUMS, [valid, x * valid, v, x * v, x * x * valid, v * v]):
+                state[name][s, band][rows] += term
+            state["latest"][s, band][rows] = values
+            state["latest_year"][s, h] = years[y]
+
+    state["window"] = window
+    state["window_times"] = times[len(times) - len(window):]
+    state["last_time"] = times[-1]
+    return np.count_nonzero(fresh)
+
+# Open the new months, from a file passed on the command line or else from the store
+run.phase("load")
+if len(sys.argv) > 1:
+    ds = open_raw(sys.argv[1])
+else:
+    ds = open_input()
+lats = ds.latitude.values
+lons = ds.longitude.values
+
+state = load_state(lats, lons) or new_state(lats, lons)
+t2m = ds["t2m"].sel(time=ds.time > state["last_time"])
+
+# Only add the new months up to the first one with missing values, like the latest expver 1
+# months that are still NaN, so they are added once their values arrive instead of never
+run.phase("check", items=t2m.size)
+complete = np.ones(t2m.sizes["time"], dtype=bool)
+for start in range(0, len(lats), band_size):
+    complete &= np.isfinite(t2m.isel(latitude=slice(start, start + band_size)).values).all(axis=(1, 2))
+if not complete.all():
+    first_missing = int(np.argmin(complete))
+    print(f"{str(t2m.time.values[first_missing])[:7]} still has missing values, only adding the months before it")
+    t2m = t2m.isel(time=slice(0, first_missing))
+if t2m.sizes["time"] == 0:
+    print(f"No complete months after {str(state['last_time'])[:7]}, nothing to update")
+    sys.exit(0)
+
+# Add the new months, a block at a time so building the state from the full history fits in memory
+run.phase("reduce", items=t2m.size)
+completed = 0
+blocks = range(0, t2m.sizes["time"], HISTORY_BLOCK)
+for start in tqdm(blocks, desc="Processing months", disable=len(blocks) == 1):
+    completed += update(state, t2m.isel(time=slice(start, start + HISTORY_BLOCK)))
+run.phase("write state")
+save_state(state)
+print(f"Added {t2m.sizes['time']} months up to {str(state['last_time'])[:7]}, completing {completed} hemisphere seasons")
+
+# Fit the lines from the running sums, the same statistics make-regression-netcdf.py saves. Each
+# season's hemispheres can have their latest season in different years, so every variable
+# records the end year of each hemisphere.
+run.phase("regression", items=len(lats) * len(lons))
+data_vars = {}
+for s, season in enumerate(SEASONS):
+    results = linregress_from_sums(*(state[name][s] for name in SUMS), x_offset=start_year)
+    end_years = {f"end_year_{hemisphere}": int(state["latest_year"][s, h]) for h, hemisphere in enumerate(HEMISPHERES)}
+    for stat in STATS:
+        data_vars[f"{season}_{stat}"] = xr.DataArray(results[stat], dims=["latitude", "longitude"], attrs={"start_year": start_year, **end_years})
+
+slope_ds = xr.Dataset(data_vars, coords={"latitude": lats, "longitude": lons})
+slope_ds.attrs["last_month"] = str(state["last_time"])[:7]
+
+# Save the slope data to its own NetCDF file, so the robust and bootstrap statistics in the
+# file of make-regression-netcdf.py are left alone
+run.phase("write")
+output_file_name = f"seasonal_slopes_{start_year}_incremental.nc"
+output_file = os.path.join(output_dir, output_file_name)
+slope_ds.to_netcdf(f"{output_file}.tmp", engine="netcdf4")
+os.replace(f"{output_file}.tmp", output_file)
+print(f"Saved {output_file_name}\n\n")
@@ -0,0 +1,126 @@
+import operator
+import re
+
+import numpy as np
+
+# Mean radius of the Earth in kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+# Function to find the edges of each cell from the cell centers, clipped to the given limits
+def cell_edges(centers, low, high):
+    centers = np.asarray(centers, dtype=np.float64)
+    midpoints = (centers[1:] + centers[:-1]) / 2
+    first = centers[0] - (midpoints[0] - centers[0])
+    last = centers[-1] + (centers[-1] - midpoints[-1])
+    edges = np.concatenate([[first], midpoints, [last]])
+    return np.clip(edges, low, high)
+
+# Function to calculate the exact area in km² of each cell of a regular latitude/longitude grid.
+# The area of a cell on a sphere is R² * Δλ * (sin φ1 - sin φ2), so it only depends on the
+# latitude edges and the width in longitude of each cell.
+def cell_area_weights(lats, lons):
+    lat_edges = np.deg2rad(cell_edges(lats, -90, 90))
+    band = np.abs(np.sin(lat_edges[1:]) - np.sin(lat_edges[:-1]))
+
+    # Longitude widths wrap around the globe, so the last cell meets the first one
+    lons = np.asarray(lons, dtype=np.float64)
+    gaps = np.diff(lons, append=lons[0] + 360) % 360
+    widths = np.deg2rad((gaps + np.roll(gaps, 1)) / 2)
+
+    return EARTH_RADIUS_KM ** 2 * np.outer(band, widths)
+
+# Function to weight each cell of a grid by the cosine of its latitude, the relative area that
+# percentage-analysis.json has always been measured in
+def cos_latitude_weights(lats, lons):
+    return np.broadcast_to(np.cos(np.deg2rad(np.asarray(lats, dtype=np.float64)))[:, None], (len(lats), len(lons)))
+
+# Comparison operators allowed in a condition, longest first so ">=" is not read as ">"
+COMPARISONS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+
+# A term is a number, or an optionally scaled and optionally absolute variable,
+# e.g. "0", "summer_slope", "2 * summer_slope" or "abs(latitude)"
+TERM = re.compile(
+    r"^(?:(?P<number>-?\d+(?:\.\d*)?)"
+    r"|(?:(?P<scale>-?\d+(?:\.\d*)?)\s*\*\s*)?(?:(?P<abs>abs)\(\s*(?P<inner>\w+)\s*\)|(?P<name>\w+)))$"
+)
+
+# Function to parse one side of a comparison into (scale, name, absolute), or
+# (number, None, False) for a constant
+def parse_term(text, expression):
+    match = TERM.match(text.strip())
+    if match is None:
+        raise ValueError(f"Cannot read {text.strip()!r} in condition {expression!r}")
+    if match["number"] is not None:
+        return float(match["number"]), None, False
+    scale = float(match["scale"]) if match["scale"] is not None else 1.0
+    return scale, match["inner"] or match["name"], match["abs"] is not None
+
+# Function to parse a condition into a table of comparisons that must all hold,
+# e.g. "(summer_slope > 0) & (abs(latitude) > 60)" becomes
+# [((1.0, "summer_slope", False), ">", (0.0, None, False)),
+#  ((1.0, "latitude", True), ">", (60.0, None, False))]
+def parse_condition(expression):
+    table = []
+    for part in expression.split("&"):
+        part = part.strip()
+        while part.startswith("(") and part.endswith(")"):
+            part = part[1:-1].strip()
+        for symbol in COMPARISONS:
+            left, found, right = part.partition(symbol)
+            if found:
+                table.append((parse_term(left, expression), symbol, parse_term(right, expression)))
+                break
+        else:
+            raise ValueError(f"No comparison in {part!r} of condition {expression!r}")
+    return table
+
+# Function to get the values of a parsed term from the named arrays
+def term_values(term, variables):
+    scale, name, absolute = term
+    if name is None:
+        return scale
+    if name not in variables:
+        raise KeyError(f"Unknown variable {name!r} in condition, expected one of {sorted(variables)}")
+    values = np.abs(variables[name]) if absolute else variables[name]
+    return values if scale == 1.0 else scale * values
+
+# Function to evaluate a condition written as comparisons over the named arrays
+# joined with "&", e.g. "(summer_slope > 0) & (abs(latitude) > 60)"
+def evaluate_condition(expression, variables):
+    result = True
+    for left, symbol, right in parse_condition(expression):
+        result = result & COMPARISONS[symbol](term_values(left, variables), term_values(right, variables))
+    return np.asarray(result, dtype=bool)
+
+# Function to calculate the area covered by each condition in each latitude row of the
+# grid, as a (condition, latitude) array. Rows are independent, so the grid can be split
+# into bands of rows without changing the result.
+def condition_row_areas(conditions, variables, weights):
+    masks = np.stack([
+        np.broadcast_to(evaluate_condition(conditions[name], variables), weights.shape)
+        for name in conditions
+    ])
+    return np.where(masks, weights, 0.0).sum(axis=-1)
+
+# Function to calculate the area and percentage of the grid covered by each condition.
+# conditions maps a name to an expression. row_areas can be passed in if the areas of
+# each row were already calculated, e.g. in parallel.
+def area_fractions(conditions, variables, weights, row_areas=None):
+    names = list(conditions)
+    if row_areas is None:
+        row_areas = condition_row_areas(conditions, variables, weights)
+    areas = row_areas.sum(axis=1)
+    total_area = float(weights.sum())
+
+    results = {"earth_area": total_area}
+    for name, area in zip(names, areas):
+        results[f"{name}_area"] = float(area)
+        results[f"{name}_percentage"] = float(area / total_area * 100)
+    return results
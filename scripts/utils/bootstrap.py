@@ -0,0 +1,75 @@
+import numpy as np
+
+from utils.records import sorted_quantiles
+
+# The bootstrap statistics returned for every series
+BOOTSTRAP_STATS = ["slope_ci_low", "slope_ci_high"]
+
+# Most bytes of resampled sums held at a time
+MAX_BYTES = 2 ** 28
+
+# Function to draw the circular block bootstrap resamples of a series of n points: each
+# resample is made of blocks of block_length consecutive points, starting anywhere and
+# wrapping around the end, so that the autocorrelation within blocks is kept. Returns a
+# (resamples, n) matrix of how many times each point appears in each resample, which is all
+# the least squares fit needs, so one matrix serves every series.
+def block_bootstrap_counts(n, resamples, block_length=None, seed=0):
+    if block_length is None:
+        block_length = max(1, int(round(n ** (1 / 3))))
+    block_length = min(block_length, n)
+    rng = np.random.default_rng(seed)
+
+    n_blocks = -(-n // block_length)
+    starts = rng.integers(0, n, size=(resamples, n_blocks))
+    indexes = (starts[:, :, None] + np.arange(block_length)).reshape(resamples, -1)[:, :n] % n
+
+    counts = np.zeros((resamples, n))
+    np.add.at(counts, (np.arange(resamples)[:, None], indexes), 1)
+    return counts
+
+# Function to find the percentile bootstrap confidence interval of the least squares slope of
+# x vs. every series in y, in the layout of linregress_batch. counts comes from
+# block_bootstrap_counts. Each resample is fitted as a weighted least squares line, with
+# the weights the counts of the valid points, so the sums for every resample and cell come
+# out of a few matrix products. Cells are processed in blocks that keep those sums within
+# MAX_BYTES. Resamples with fewer than 2 distinct valid years are left out of the interval.
+def bootstrap_slope_ci(x, y, counts, confidence=0.95, max_bytes=MAX_BYTES):
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x.mean()
+    y = np.asarray(y)
+    shape = y.shape[1:]
+    y = y.reshape(len(x), -1)
+
+    # Weights of each point in each resample, with x folded in
+    count_x = counts * x
+    count_xx = counts * x ** 2
+    tails = [(1 - confidence) / 2, (1 + confidence) / 2]
+
+    results = {stat: np.full(y.shape[1], np.nan) for stat in BOOTSTRAP_STATS}
+    chunk_size = max(1, max_bytes // (len(counts) * 8 * 6))
+    for start in range(0, y.shape[1], chunk_size):
+        block = slice(start, start + chunk_size)
+        values = y[:, block].astype(np.float64)
+        valid = (~np.isnan(values)).astype(np.float64)
+        values = np.where(valid > 0, values, 0)
+
+        n = counts @ valid
+        sx = count_x @ valid
+        sxx = count_xx @ valid
+        sy = counts @ values
+        sxy = count_x @ values
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ssx = sxx - sx ** 2 / n
+            slopes = (sxy - sx * sy / n) / ssx
+        slopes[~(ssx > 1e-9 * sxx)] = np.nan
+
+        low, high = _nan_quantiles(slopes, tails)
+        results["slope_ci_low"][block] = low
+        results["slope_ci_high"][block] = high
+
+    return {stat: values.reshape(shape) for stat, values in results.items()}
+
+# Function to take quantiles along the first axis, ignoring NaNs, for every column at once,
+# interpolating linearly between the sorted values like np.quantile
+def _nan_quantiles(values, quantiles):
+    return sorted_quantiles(np.sort(values, axis=0), (~np.isnan(values)).sum(axis=0), quantiles)
@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import zlib
+import shutil
+import zipfile
+import numpy as np
+
+# Define the directory for the checkpoints
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+checkpoint_dir = os.path.join(dirname, "data", "output", "checkpoints")
+
+# Function to write a file through a temporary file that is only moved into place once it is
+# complete and on disk, so the file is never left half written. write is called with the
+# open temporary file.
+def write_atomic(path, write, mode="wb"):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, mode) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+# Function to describe some files by their size and modification time, so results computed
+# from them are only reused while they are unchanged. Missing files are left out.
+def file_fingerprint(paths):
+    return {os.path.basename(path): [os.path.getsize(path), os.path.getmtime(path)] for path in paths if os.path.exists(path)}
+
+# Function to describe an array by its shape, type and a checksum of its contents
+def describe_array(array):
+    array = np.ascontiguousarray(array)
+    return {"shape": list(array.shape), "dtype": str(array.dtype), "crc32": zlib.crc32(array.data)}
+
+# The finished units of work (e.g. bands of latitude rows) of a long-running stage, saved as
+# they finish so that a run that is killed can resume where it stopped.
+#
+# Each unit's arrays are saved to their own .npz file, then recorded in manifest.json with
+# their shapes and checksums. Both are written atomically, so a unit is either in the manifest
+# with complete files or not there at all. A run only resumes from the checkpoints of a run
+# with the same key, which should cover everything the results depend on, and only reuses units
+# whose files still match the manifest. Call clear() once the stage's output is saved.
+class Checkpoint:
+    def __init__(self, stage, key):
+        self.stage = stage
+        self.dir = os.path.join(checkpoint_dir, stage)
+        self.manifest_file = os.path.join(self.dir, "manifest.json")
+        self.key = json.loads(json.dumps(key))
+        self.units = {}
+
+        manifest = None
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, "r") as f:
+                    manifest = json.load(f)
+            except ValueError:
+                pass
+
+        if manifest is not None and manifest.get("key") == self.key:
+            self.units = manifest["units"]
+            if self.units:
+                print(f"Resuming {stage} from {len(self.units)} checkpoints")
+        else:
+            # Checkpoints of a different run can't be used, so start afresh
+            shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir, exist_ok=True)
+
+    # Function to load the arrays of a finished unit, or None if it hasn't finished or its
+    # file doesn't match the manifest, in which case it has to be run again
+    def load(self, unit):
+        entry = self.units.get(unit)
+        if entry is None:
+            return None
+        try:
+            with np.load(os.path.join(self.dir, entry["file"])) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            arrays = None
+
+        if arrays is None or {name: describe_array(array) for name, array in arrays.items()} != entry["arrays"]:
+            print(f"Checkpoint {unit} of {self.stage} is damaged, running it again")
+            del self.units[unit]
+            return None
+        return arrays
+
+    # Function to save the arrays of a finished unit and record it in the manifest
+    def save(self, unit, **arrays):
+        file_name = re.sub(r"[^\w.-]+", "_", unit) + ".npz"
+        write_atomic(os.path.join(self.dir, file_name), lambda f: np.savez(f, **arrays))
+        self.units[unit] = {"file": file_name, "arrays": {name: describe_array(array) for name, array in arrays.items()}}
+        write_atomic(self.manifest_file, lambda f: json.dump({"key": self.key, "units": self.units}, f), mode="w")
+
+    # Function to delete the checkpoints, once the output they were for is saved
+    def clear(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.units = {}
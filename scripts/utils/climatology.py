@@ -0,0 +1,68 @@
+import os
+import json
+import numpy as np
+import xarray as xr
+from tqdm import tqdm
+
+from utils.store import input_fingerprint
+from utils.seasons import SEASONS, month_weights
+
+# Define the directory for the cached climatologies
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+climatology_dir = os.path.join(dirname, "data", "output", "climatology")
+
+# Function to calculate the mean of every calendar month in every grid cell as a (month,
+# latitude, longitude) array, one year of months at a time. NaNs are skipped, and cells with
+# no valid values in a month are NaN.
+def compute_climatology(t2m):
+    months = t2m.time.dt.month.values - 1
+    sums = np.zeros((12,) + t2m.shape[1:])
+    counts = np.zeros((12,) + t2m.shape[1:])
+    for start in tqdm(range(0, t2m.sizes["time"], 12), desc="Averaging the baseline"):
+        block = t2m.isel(time=slice(start, start + 12)).values.astype(np.float64)
+        for month, values in zip(months[start:start + 12], block):
+            valid = ~np.isnan(values)
+            sums[month] += np.where(valid, values, 0)
+            counts[month] += valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+# Function to load the climatology of the baseline years from the cache in Kelvin, computing
+# and caching it first when it is missing or the input has changed
+def load_climatology(ds, baseline_start, baseline_end):
+    key = {"baseline": [baseline_start, baseline_end], "input": input_fingerprint(ds)}
+    cache_file = os.path.join(climatology_dir, f"climatology_{baseline_start}_{baseline_end}.nc")
+
+    if os.path.exists(cache_file):
+        with xr.open_dataset(cache_file, engine="netcdf4") as cached:
+            if json.loads(cached.attrs["key"]) == key:
+                return cached["t2m"].load()
+
+    baseline = ds["t2m"].sel(time=slice(f"{baseline_start}-01-01", f"{baseline_end}-12-31"))
+    missing = sorted(set(range(1, 13)) - set(baseline.time.dt.month.values))
+    if missing:
+        raise ValueError(f"The input has no data for months {missing} in the baseline {baseline_start}-{baseline_end}")
+
+    print(f"Calculating the {baseline_start}-{baseline_end} climatology")
+    climatology = xr.DataArray(
+        compute_climatology(baseline),
+        dims=["month", "latitude", "longitude"],
+        coords={"month": np.arange(1, 13), "latitude": ds.latitude.values, "longitude": ds.longitude.values},
+        name="t2m"
+    )
+
+    # Save to a temporary file and only replace the cache once it is complete
+    os.makedirs(climatology_dir, exist_ok=True)
+    temp_file = f"{cache_file}.tmp"
+    climatology.to_dataset(name="t2m").assign_attrs(key=json.dumps(key)).to_netcdf(temp_file, engine="netcdf4")
+    os.replace(temp_file, cache_file)
+    return climatology
+
+# Function to compose the monthly climatology into each season in each hemisphere, like the
+# seasonal temperatures, as a (season, latitude, longitude) array
+def seasonal_climatology(climatology, lats, seasons=SEASONS):
+    weights = month_weights(seasons)
+    result = np.full((len(seasons),) + climatology.shape[1:], np.nan)
+    for h, rows in enumerate([lats >= 0, lats < 0]):
+        result[:, rows] = np.tensordot(weights[:, h], climatology[:, rows], axes=1)
+    return result
@@ -0,0 +1,19 @@
+import os
+import dask
+from dask.utils import parse_bytes
+
+from CONFIG import use_dask, workers, memory_limit
+
+# Number of worker threads or processes, using every core when workers is not set
+num_workers = workers or os.cpu_count()
+
+# Run dask on a thread pool with the configured number of workers
+if use_dask:
+    dask.config.set(scheduler="threads", num_workers=num_workers)
+
+# Function to chunk a DataArray along dim, keeping every other dimension whole, so that
+# every worker can hold `copies` float64 chunks at once within the memory limit
+def chunk_along(da, dim, copies=4):
+    slice_bytes = da.size // da.sizes[dim] * 8
+    size = max(1, int(parse_bytes(memory_limit) / (num_workers * copies * slice_bytes)))
+    return da.chunk({d: (size if d == dim else -1) for d in da.dims})
@@ -0,0 +1,72 @@
+import json
+import struct
+import numpy as np
+
+# Layout of a flat binary file:
+#
+#   bytes 0-7    magic, b"TSFLAT1\0"
+#   bytes 8-11   length of the JSON header in bytes, little-endian uint32
+#   bytes 12-    JSON header, padded with spaces so the data starts on a 64-byte boundary
+#   then         each variable as a contiguous little-endian float32 array in C order,
+#                starting on a 64-byte boundary
+#
+# The JSON header holds the coordinates, e.g. {"year": [...], "latitude": [...], "longitude": [...]},
+# and for every variable its name, dims, shape and byte offset from the start of the file.
+MAGIC = b"TSFLAT1\0"
+ALIGNMENT = 64
+DTYPE = np.dtype("<f4")
+
+# Function to round a byte count up to the alignment
+def align(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+# Function to write the data variables and coordinates of an xarray Dataset to a flat binary file
+def write_flat(ds, path):
+    variables = [name for name in ds.data_vars]
+    coords = {name: ds[name].values.tolist() for name in ds.dims}
+
+    # The header size depends on the offsets it contains, so grow it until it fits
+    header_size = ALIGNMENT
+    while True:
+        offset = header_size
+        entries = []
+        for name in variables:
+            entries.append({"name": name, "dims": list(ds[name].dims), "shape": list(ds[name].shape), "offset": offset})
+            offset = align(offset + ds[name].size * DTYPE.itemsize)
+        header = json.dumps({"dtype": DTYPE.str, "coords": coords, "variables": entries}).encode("utf-8")
+        if len(MAGIC) + 4 + len(header) <= header_size:
+            break
+        header_size = align(len(MAGIC) + 4 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)))
+        f.write(header.ljust(header_size - len(MAGIC) - 4))
+        for entry in entries:
+            f.seek(entry["offset"])
+            da = ds[entry["name"]]
+            if da.ndim > 1:
+                # Write a few entries of the first dimension at a time, to bound memory
+                step = max(1, 2 ** 24 // da[0].size)
+                for start in range(0, len(da), step):
+                    f.write(np.ascontiguousarray(da[start:start + step].values, dtype=DTYPE).tobytes())
+            else:
+                f.write(np.ascontiguousarray(da.values, dtype=DTYPE).tobytes())
+        f.truncate(offset)
+
+# Function to read the JSON header of a flat binary file
+def read_flat_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a flat binary file")
+        (length,) = struct.unpack("<I", f.read(4))
+        return json.loads(f.read(length))
+
+# Function to open a flat binary file as read-only memory-mapped arrays, without copying.
+# Returns the header and a dict of arrays by variable name.
+def open_flat(path):
+    header = read_flat_header(path)
+    arrays = {
+        entry["name"]: np.memmap(path, dtype=header["dtype"], mode="r", offset=entry["offset"], shape=tuple(entry["shape"]))
+        for entry in header["variables"]
+    }
+    return header, arrays
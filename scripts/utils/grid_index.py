@@ -0,0 +1,95 @@
+import os
+import pickle
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utils.area import EARTH_RADIUS_KM
+
+# Define the path of the serialized index
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+index_path = os.path.join(dirname, "data", "output", "grid_index.pkl")
+
+# Function to convert latitudes and longitudes in degrees into 3D unit vectors
+def unit_vectors(lat, lon):
+    lat = np.deg2rad(lat)
+    lon = np.deg2rad(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+# Function to calculate the great-circle distance in km between two sets of points
+def great_circle_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.deg2rad, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+# Function to check whether coordinates are evenly spaced
+def is_regular(values):
+    steps = np.diff(values)
+    return len(values) > 1 and np.allclose(steps, steps[0])
+
+# Function to build the spatial index of a grid. Regular grids, like ERA5, only need their
+# origin and spacing, because the cell containing a point can be computed from its
+# coordinates. Other grids get a KD-tree on 3D unit vectors, so distances are chords on
+# the sphere and there is no seam at ±180° or distortion near the poles.
+def build_grid_index(lats, lons):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    index = {"lats": lats, "lons": lons, "regular": is_regular(lats) and is_regular(lons)}
+    if not index["regular"]:
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        index["tree"] = cKDTree(unit_vectors(lat_grid.ravel(), lon_grid.ravel()))
+    return index
+
+# Function to load the serialized index, building and saving it if it is missing or was
+# built for a different grid
+def load_grid_index(lats, lons):
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as f:
+            index = pickle.load(f)
+        if np.array_equal(index["lats"], lats) and np.array_equal(index["lons"], lons):
+            return index
+
+    index = build_grid_index(lats, lons)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    with open(index_path, "wb") as f:
+        pickle.dump(index, f)
+    return index
+
+# Function to find which points the grid can't answer: those with a coordinate that isn't a
+# finite number, a latitude outside -90 to 90, or a coordinate more than half a cell outside
+# the grid. Longitudes on a global grid can be given from -180 to 360.
+def outside_grid(index, lat, lon):
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    lats, lons = index["lats"], index["lons"]
+    with np.errstate(invalid="ignore"):
+        outside = ~np.isfinite(lat) | ~np.isfinite(lon) | (np.abs(lat) > 90)
+        lat_margin = np.abs(np.diff(lats)).min() / 2 if len(lats) > 1 else 0
+        outside |= (lat < lats.min() - lat_margin) | (lat > lats.max() + lat_margin)
+        lon_step = np.abs(np.diff(lons)).min() if len(lons) > 1 else 0
+        if np.isclose(lon_step * len(lons), 360):
+            outside |= (lon < -180) | (lon > 360)
+        else:
+            outside |= (lon < lons.min() - lon_step / 2) | (lon > lons.max() + lon_step / 2)
+    return outside
+
+# Function to find the grid cell of every point at once. Returns the latitude and longitude
+# indexes of each cell and the great-circle distance in km from each point to its cell center.
+def query_grid_index(index, lat, lon):
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    lats, lons = index["lats"], index["lons"]
+
+    if index["regular"]:
+        # The nearest row, and the nearest column, wrapping around the globe for global grids
+        lat_index = np.clip(np.rint((lat - lats[0]) / (lats[1] - lats[0])), 0, len(lats) - 1).astype(np.int64)
+        lon_step = lons[1] - lons[0]
+        if np.isclose(lon_step * len(lons), 360):
+            lon_index = np.rint(((lon - lons[0]) % 360) / lon_step).astype(np.int64) % len(lons)
+        else:
+            lon_index = np.clip(np.rint((lon - lons[0]) / lon_step), 0, len(lons) - 1).astype(np.int64)
+    else:
+        _, flat_index = index["tree"].query(unit_vectors(lat, lon))
+        lat_index, lon_index = np.unravel_index(flat_index, (len(lats), len(lons)))
+
+    distance = great_circle_km(lat, lon, lats[lat_index], lons[lon_index])
+    return lat_index, lon_index, distance
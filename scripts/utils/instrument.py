@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import platform
+import resource
+from datetime import datetime, timezone
+
+from CONFIG import profile_stages
+
+# Define the directory for the run reports
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+report_dir = os.path.join(dirname, "data", "output", "reports")
+
+# Most functions listed in the profile of a run
+PROFILE_TOP = 25
+
+# Function to read the bytes this process has read and written through system calls so far,
+# or None where the kernel doesn't report them
+def _io_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+# Function to read the peak resident memory of this process in bytes, since it started or
+# since the peak was last reset. ru_maxrss is in bytes on macOS and in KiB elsewhere.
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# Function to reset the peak resident memory to the memory in use now, so the peak of each
+# phase can be measured on its own. Returns whether the kernel supports it (Linux only).
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+# Function to read the CPU time of this process and of its child processes that have finished,
+# like the workers of the process pool
+def _cpu_time():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+# Function to take the counters that phases are measured with
+def _snapshot():
+    read, written = _io_bytes()
+    return {"wall": time.perf_counter(), "cpu": _cpu_time(), "read": read, "written": written}
+
+# Function to measure what happened between two snapshots, with the peak memory in between
+def _measure(before, after, peak):
+    measured = {
+        "wall_s": after["wall"] - before["wall"],
+        "cpu_s": after["cpu"] - before["cpu"],
+        "peak_rss_mb": peak / 2 ** 20,
+        "bytes_read": None,
+        "bytes_written": None,
+    }
+    if before["read"] is not None:
+        measured["bytes_read"] = after["read"] - before["read"]
+        measured["bytes_written"] = after["written"] - before["written"]
+    return measured
+
+# Records the phases of one run of a stage, one after another: starting a phase ends the
+# one before it. The report is saved as JSON to data/output/reports/{stage}.json when the
+# script exits, with a profile of the hottest functions if profile_stages is on.
+class Run:
+    def __init__(self, stage):
+        self.stage = stage
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.start = _snapshot()
+        self.phases = []
+        self.current = None
+        self.error = None
+        self.peak = _peak_rss()
+        self.phase_peaks = False
+        self.profiler = None
+        if profile_stages:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    # Function to start a phase, optionally with the number of items (grid cells, months,
+    # cities...) it processes so the report can give a rate
+    def phase(self, name, items=None, unit="cells"):
+        self.end_phase()
+        self.phase_peaks = _reset_peak_rss()
+        self.current = {"name": name, "items": items, "unit": unit, "before": _snapshot()}
+
+    # Function to set or add to the number of items the current phase processes
+    def count(self, items, unit=None):
+        self.current["items"] = (self.current["items"] or 0) + items
+        if unit:
+            self.current["unit"] = unit
+
+    def end_phase(self):
+        if self.current is None:
+            return
+        before = self.current.pop("before")
+        peak = _peak_rss()
+        self.peak = max(self.peak, peak)
+        measured = {**self.current, **_measure(before, _snapshot(), peak)}
+        if measured["items"] and measured["wall_s"] > 0:
+            measured["items_per_s"] = measured["items"] / measured["wall_s"]
+        self.phases.append(measured)
+        self.current = None
+
+    def report(self):
+        self.end_phase()
+        report = {
+            "stage": self.stage,
+            "started_at": self.started_at,
+            "argv": sys.argv,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "status": "failed" if self.error else "ok",
+            "error": self.error,
+            "total": _measure(self.start, _snapshot(), max(self.peak, _peak_rss())),
+            "phase_peak_rss": "per phase" if self.phase_peaks else "since the start of the run",
+            "phases": self.phases,
+        }
+        if self.profiler:
+            self.profiler.disable()
+            report["profile"] = _hottest(self.profiler)
+        return report
+
+    # Function to stop the run with an error message, recording it in the report. A SystemExit
+    # raised directly never reaches the excepthook, so the report would say the run was ok.
+    def fail(self, message):
+        self.error = f"SystemExit: {message}"
+        raise SystemExit(message)
+
+    def save(self):
+        report = self.report()
+        os.makedirs(report_dir, exist_ok=True)
+        report_file = os.path.join(report_dir, f"{self.stage}.json")
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+        total = report["total"]
+        print(f"{self.stage} took {total['wall_s']:.1f} s, peak memory {total['peak_rss_mb']:.0f} MB, report in data/output/reports")
+
+# Function to list the functions with the most cumulative time in a profile
+def _hottest(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (file, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(file)}:{line}({function})",
+            "calls": calls,
+            "own_s": own,
+            "cumulative_s": cumulative,
+        })
+    return sorted(rows, key=lambda row: row["cumulative_s"], reverse=True)[:PROFILE_TOP]
+
+# Function to start recording the run of a script, saving the report when it exits
+def start_run(script):
+    run = Run(os.path.splitext(os.path.basename(script))[0])
+    atexit.register(run.save)
+
+    # Note an uncaught exception in the report, which is still saved at exit
+    excepthook = sys.excepthook
+    def record_error(kind, value, traceback):
+        run.error = f"{kind.__name__}: {value}"
+        excepthook(kind, value, traceback)
+    sys.excepthook = record_error
+    return run
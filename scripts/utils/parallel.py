@@ -0,0 +1,107 @@
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from tqdm import tqdm
+
+from CONFIG import band_size
+from utils.compute import num_workers
+
+# Bands per worker, so workers that finish early can pick up more
+BANDS_PER_WORKER = 4
+
+# Arrays of the running map_bands call. The workers are forked from this process, so they
+# inherit them as views of the same shared memory instead of receiving copies.
+_arrays = {}
+
+# numpy arrays in shared memory, released when the with block exits. The workers of
+# map_bands write their results straight into these arrays.
+class SharedArrays:
+    def __init__(self):
+        self.arrays = {}
+        self._blocks = []
+
+    # Function to allocate an array in shared memory, optionally filled with a value
+    def empty(self, name, shape, dtype=np.float64, fill=None):
+        size = max(1, math.prod(shape) * np.dtype(dtype).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self._blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if fill is not None:
+            array.fill(fill)
+        self.arrays[name] = array
+        return array
+
+    # Function to read a DataArray into shared memory, band_size latitude rows at a time
+    def load(self, name, data):
+        axis = data.dims.index("latitude")
+        array = self.empty(name, data.shape, data.dtype)
+        for start in range(0, data.sizes["latitude"], band_size):
+            band = slice(start, start + band_size)
+            array[(slice(None),) * axis + (band,)] = data.isel(latitude=band).values
+        return array
+
+    # Function to copy an array into shared memory
+    def copy(self, name, values):
+        values = np.asarray(values)
+        array = self.empty(name, values.shape, values.dtype)
+        array[...] = values
+        return array
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.arrays.clear()
+        for block in self._blocks:
+            # The memory itself is freed once the last view of it is gone
+            try:
+                block.close()
+            except BufferError:
+                pass
+            block.unlink()
+        self._blocks = []
+
+def _run_band(func, band):
+    func(band, _arrays)
+
+# Function to run func(band, arrays) for every band of n_rows latitude rows on a pool of
+# `workers` processes. Only the function and the band are sent to each task; func reads its
+# inputs from, and writes its outputs to, the shared arrays. The bands are small enough to
+# give every worker several, and at most band_size rows. Processes are forked, so functions
+# defined in the scripts can be used. Where fork isn't available, the bands run in turn.
+#
+# To checkpoint the bands, restore(band) can fill a band's outputs from an earlier run and
+# return True to skip it, and save(band) is called in this process as each band finishes.
+def map_bands(func, n_rows, arrays, desc="Processing latitude bands", restore=None, save=None):
+    global _arrays
+    rows = max(1, min(band_size, math.ceil(n_rows / (BANDS_PER_WORKER * num_workers))))
+    bands = [slice(start, start + rows) for start in range(0, n_rows, rows)]
+    if restore:
+        bands = [band for band in bands if not restore(band)]
+    if not bands:
+        return
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Process pools need the fork start method, running the bands in this process")
+        for band in tqdm(bands, desc=desc):
+            func(band, arrays)
+            if save:
+                save(band)
+        return
+
+    _arrays = arrays
+    try:
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=min(num_workers, len(bands)), mp_context=context) as pool:
+            futures = {pool.submit(_run_band, func, band): band for band in bands}
+            for future in tqdm(as_completed(futures), total=len(bands), desc=desc):
+                future.result()
+                if save:
+                    save(futures[future])
+    finally:
+        _arrays = {}
@@ -0,0 +1,53 @@
+// Reads flat binary files written by scripts/utils/flat_binary.py
+// (see that file for the layout). The data is little-endian float32.
+const fs = require("fs");
+
+const MAGIC = "TSFLAT1\0";
+
+// Read the JSON header from the start of a file
+function readFlatHeader(path) {
+  const fd = fs.openSync(path, "r");
+  const prefix = Buffer.alloc(12);
+  fs.readSync(fd, prefix, 0, 12, 0);
+  if (prefix.toString("latin1", 0, 8) !== MAGIC) {
+    fs.closeSync(fd);
+    throw new Error(`${path} is not a flat binary file`);
+  }
+  const length = prefix.readUInt32LE(8);
+  const json = Buffer.alloc(length);
+  fs.readSync(fd, json, 0, length, 12);
+  fs.closeSync(fd);
+  return JSON.parse(json.toString("utf8"));
+}
+
+// Wrap bytes as a Float32Array without copying when they are 4-byte aligned
+function toFloat32(buffer, byteOffset, length) {
+  const start = buffer.byteOffset + byteOffset;
+  if (start % 4 === 0) return new Float32Array(buffer.buffer, start, length);
+  return new Float32Array(buffer.buffer.slice(start, start + length * 4));
+}
+
+// Read a whole file, returning the header, the coordinates and a Float32Array per variable
+function readFlat(path) {
+  const header = readFlatHeader(path);
+  const buffer = fs.readFileSync(path);
+  const variables = {};
+  header.variables.forEach(({ name, shape, offset }) => {
+    variables[name] = toFloat32(buffer, offset, shape.reduce((a, b) => a * b, 1));
+  });
+  return { header, coords: header.coords, variables };
+}
+
+// Read one entry along the first dimension of a variable (e.g. one year of the season cube),
+// reading only its bytes from disk
+function readFlatSlice(path, name, index, header = readFlatHeader(path)) {
+  const { shape, offset } = header.variables.find(d => d.name === name);
+  const length = shape.slice(1).reduce((a, b) => a * b, 1);
+  const buffer = Buffer.alloc(length * 4);
+  const fd = fs.openSync(path, "r");
+  fs.readSync(fd, buffer, 0, buffer.length, offset + index * length * 4);
+  fs.closeSync(fd);
+  return toFloat32(buffer, 0, length);
+}
+
+module.exports = { readFlat, readFlatHeader, readFlatSlice };
@@ -0,0 +1,75 @@
+import numpy as np
+
+# The record statistics returned for every series, besides the rank of every year and the percentiles
+RECORD_STATS = ["record_high", "record_high_year", "record_low", "record_low_year", "valid_years"]
+
+# The statistics that are whole numbers, including the rank
+WHOLE_STATS = ["rank", "record_high_year", "record_low_year", "valid_years"]
+
+# Function to name the statistics returned by record_stats for some percentiles, e.g. p10 and p97_5
+def record_stat_names(percentiles):
+    return RECORD_STATS + [f"p{percentile:g}".replace(".", "_") for percentile in percentiles]
+
+# Function to interpolate quantiles along the first axis of values that are already sorted with
+# the NaNs last, for every column at once, like np.quantile. counts is the number of valid
+# values in each column, and columns with none are NaN.
+def sorted_quantiles(ordered, counts, quantiles):
+    results = []
+    for quantile in quantiles:
+        position = quantile * np.maximum(counts - 1, 0)
+        below = np.floor(position).astype(int)
+        above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+        fraction = position - below
+        low = np.take_along_axis(ordered, below[None], axis=0)[0]
+        high = np.take_along_axis(ordered, above[None], axis=0)[0]
+        results.append(np.where(counts > 0, low + fraction * (high - low), np.nan))
+    return results
+
+# Function to rank the years of every series in y and find their records and percentiles at
+# once, in the layout of linregress_batch: the first axis of y has one value per year, and the
+# remaining axes are independent series. NaNs are masked per series.
+#
+# Returns "rank", with the same shape as y, where 1 is the warmest year, tied years share the
+# best rank, and missing years are NaN. The other statistics have one value per series:
+# record_high and record_low and the years they were set in (the latest year, if tied), the
+# number of valid_years, and each percentile of the values, interpolated like np.percentile.
+#
+# Everything comes out of one sort along the years.
+def record_stats(years, y, percentiles=()):
+    years = np.asarray(years)
+    y = np.asarray(y, dtype=np.float64)
+    shape = y.shape[1:]
+    y = y.reshape(len(years), -1)
+    n = len(years)
+    counts = (~np.isnan(y)).sum(axis=0)
+
+    # Sort each series from coldest to warmest, with the NaNs last
+    order = np.argsort(y, axis=0, kind="stable")
+    ordered = np.take_along_axis(y, order, axis=0)
+
+    # The rank of a value is the number of valid values at or after the end of its run of
+    # equal values, so tied values share the best rank
+    positions = np.arange(n)[:, None]
+    run_ends = np.ones(ordered.shape, dtype=bool)
+    run_ends[:-1] = ordered[1:] != ordered[:-1]
+    last_equal = np.minimum.accumulate(np.where(run_ends, positions, n)[::-1], axis=0)[::-1]
+    ranks = np.empty(y.shape)
+    np.put_along_axis(ranks, order, (counts - last_equal).astype(np.float64), axis=0)
+    ranks[np.isnan(y)] = np.nan
+
+    # The warmest and coldest years are at either end of the valid values
+    valid = counts > 0
+    warmest = np.maximum(counts - 1, 0)[None]
+    results = {
+        "rank": ranks,
+        "record_high": np.where(valid, np.take_along_axis(ordered, warmest, axis=0)[0], np.nan),
+        "record_high_year": np.where(valid, years[np.take_along_axis(order, warmest, axis=0)[0]], np.nan),
+        "record_low": np.where(valid, ordered[0], np.nan),
+        "record_low_year": np.where(valid, years[np.take_along_axis(order, last_equal[:1], axis=0)[0]], np.nan),
+        "valid_years": counts.astype(np.float64),
+    }
+    quantiles = sorted_quantiles(ordered, counts, [percentile / 100 for percentile in percentiles])
+    for name, values in zip(record_stat_names(percentiles)[len(RECORD_STATS):], quantiles):
+        results[name] = values
+
+    return {stat: values.reshape(values.shape[:-1] + shape) for stat, values in results.items()}
@@ -0,0 +1,184 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+from tqdm import tqdm
+
+from utils.area import cell_edges, cell_area_weights
+
+# Define the geography and cache paths
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+topo_path = os.path.join(dirname, "data", "geo", "topo_110m.topo.json")
+geojson_path = os.path.join(dirname, "data", "input", "regions.geojson")
+cache_dir = os.path.join(dirname, "data", "output", "regions")
+
+# Function to decode the arcs of a TopoJSON topology into lists of [lon, lat] points,
+# undoing the delta encoding when the topology is quantized
+def decode_arcs(topo):
+    transform = topo.get("transform")
+    arcs = []
+    for arc in topo["arcs"]:
+        points = np.asarray(arc, dtype=np.float64)
+        if transform:
+            points = np.cumsum(points, axis=0) * transform["scale"] + transform["translate"]
+        arcs.append(points)
+    return arcs
+
+# Function to stitch a TopoJSON ring from its arc indexes. Negative indexes are reversed arcs,
+# and each arc after the first repeats the last point of the one before.
+def stitch_ring(arc_indexes, arcs):
+    points = []
+    for i, index in enumerate(arc_indexes):
+        arc = arcs[index] if index >= 0 else arcs[~index][::-1]
+        points.append(arc if i == 0 else arc[1:])
+    return np.concatenate(points)
+
+# Function to convert the geometries of a TopoJSON object into GeoJSON-style features
+def topojson_features(topo, object_name):
+    arcs = decode_arcs(topo)
+    features = []
+    for geometry in topo["objects"][object_name]["geometries"]:
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["arcs"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["arcs"]
+        else:
+            continue
+        coordinates = [[stitch_ring(ring, arcs) for ring in polygon] for polygon in polygons]
+        features.append({
+            "properties": geometry.get("properties", {}),
+            "geometry": {"type": "MultiPolygon", "coordinates": coordinates}
+        })
+    return features
+
+# Function to make a ring continuous across the ±180° meridian. Longitudes after a jump of
+# more than 180° are shifted by 360°, and a ring that goes all the way around the globe
+# (like Antarctica) is closed through the nearest pole.
+def unwrap_ring(ring):
+    ring = ring.copy()
+    jumps = np.round(np.diff(ring[:, 0]) / 360)
+    ring[1:, 0] -= 360 * np.cumsum(jumps)
+    if abs(ring[-1, 0] - ring[0, 0]) > 180:
+        pole = -90 if ring[:, 1].mean() < 0 else 90
+        ring = np.vstack([ring, [ring[-1, 0], pole], [ring[0, 0], pole], ring[:1]])
+    return ring
+
+# Function to list every ring of a Polygon or MultiPolygon as an (n, 2) array
+def geometry_rings(geometry):
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    return [unwrap_ring(np.asarray(ring, dtype=np.float64)) for polygon in polygons for ring in polygon]
+
+# Function to calculate the fraction of each grid cell covered by a set of rings, by testing
+# supersample x supersample points per cell with an even-odd scanline over the ring edges.
+# Returns the flat indexes of the covered cells and their coverage fractions.
+def cell_coverage(rings, lats, lons, supersample=4):
+    edges = np.concatenate([np.column_stack([ring[:-1], ring[1:]]) for ring in rings])
+    x1, y1, x2, y2 = edges.T
+    lon_min, lat_min = np.min([ring.min(axis=0) for ring in rings], axis=0)
+    lon_max, lat_max = np.max([ring.max(axis=0) for ring in rings], axis=0)
+
+    # Sample points inside each cell, at the centers of a supersample x supersample grid
+    offsets = (np.arange(supersample) + 0.5) / supersample
+    lat_edges = cell_edges(lats, -90, 90)
+    lon_edges = cell_edges(lons, -np.inf, np.inf)
+    rows = np.nonzero((np.maximum(lat_edges[:-1], lat_edges[1:]) >= lat_min) & (np.minimum(lat_edges[:-1], lat_edges[1:]) <= lat_max))[0]
+    sample_lons = ((lon_edges[:-1, None] + offsets * np.diff(lon_edges)[:, None] + 180) % 360 - 180).ravel()
+
+    # Unwrapped rings can reach past ±180°, so test each point again 360° to either side
+    shifts = [shift for shift in (-360, 0, 360) if lon_min <= shift + 180 and shift - 180 <= lon_max]
+
+    coverage = np.zeros((len(rows), len(lons)))
+    for r, row in enumerate(rows):
+        for offset in offsets:
+            y = lat_edges[row] + offset * (lat_edges[row + 1] - lat_edges[row])
+
+            # x positions where the edges cross this latitude, sorted
+            crosses = (y1 > y) != (y2 > y)
+            xs = np.sort(x1[crosses] + (y - y1[crosses]) * (x2[crosses] - x1[crosses]) / (y2[crosses] - y1[crosses]))
+            if len(xs) == 0:
+                continue
+
+            # A point is inside when an odd number of crossings lie to its left
+            inside = np.zeros(len(sample_lons), dtype=bool)
+            for shift in shifts:
+                inside |= np.searchsorted(xs, sample_lons + shift, side="right") % 2 == 1
+            coverage[r] += inside.reshape(len(lons), supersample).sum(axis=1)
+
+    coverage /= supersample ** 2
+    r, c = np.nonzero(coverage)
+    return rows[r] * len(lons) + c, coverage[r, c]
+
+# Function to read the regions to rasterize: the countries in the TopoJSON, plus any
+# features in data/input/regions.geojson. Every region needs a name of its own, or its
+# series would be mixed up with another region's.
+def load_region_features():
+    with open(topo_path, "r") as f:
+        topo = json.load(f)
+    features = [(feature["properties"]["NAME"], feature["geometry"]) for feature in topojson_features(topo, "countries")]
+
+    if os.path.exists(geojson_path):
+        with open(geojson_path, "r") as f:
+            collection = json.load(f)
+        for i, feature in enumerate(collection["features"]):
+            properties = feature.get("properties") or {}
+            name = str(properties.get("name", properties.get("id", feature.get("id", i))))
+            features.append((name, feature["geometry"]))
+
+    regions = {}
+    for name, geometry in features:
+        if name in regions:
+            raise ValueError(f"More than one region is named {name!r}, every country and custom region needs a name of its own")
+        regions[name] = geometry_rings(geometry)
+    return regions
+
+# Function to build the sparse (region, cell) weight matrix: the fraction of each cell
+# covered by each region times the cell's area in km²
+def build_region_weights(lats, lons, supersample=4):
+    regions = load_region_features()
+    areas = cell_area_weights(lats, lons).ravel()
+    row_indexes, col_indexes, values = [], [], []
+    for r, name in enumerate(tqdm(regions, desc="Rasterizing regions")):
+        cells, fractions = cell_coverage(regions[name], lats, lons, supersample)
+        row_indexes.append(np.full(len(cells), r))
+        col_indexes.append(cells)
+        values.append(fractions * areas[cells])
+    weights = sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(row_indexes), np.concatenate(col_indexes))),
+        shape=(len(regions), len(lats) * len(lons))
+    )
+    return list(regions), weights
+
+# Function to load the region weights from the cache, rebuilding them when the grid,
+# the supersampling or the source geography has changed
+def load_region_weights(lats, lons, supersample=4):
+    sources = [path for path in [topo_path, geojson_path] if os.path.exists(path)]
+    key = {
+        "shape": [len(lats), len(lons)],
+        "latitude": [float(lats[0]), float(lats[-1])],
+        "longitude": [float(lons[0]), float(lons[-1])],
+        "supersample": supersample,
+        "sources": {os.path.basename(path): [os.path.getsize(path), os.path.getmtime(path)] for path in sources},
+    }
+    matrix_file = os.path.join(cache_dir, "region_weights.npz")
+    index_file = os.path.join(cache_dir, "region_weights.json")
+
+    if os.path.exists(matrix_file) and os.path.exists(index_file):
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        if index["key"] == key:
+            return index["regions"], sparse.load_npz(matrix_file)
+
+    regions, weights = build_region_weights(lats, lons, supersample)
+    os.makedirs(cache_dir, exist_ok=True)
+    sparse.save_npz(matrix_file, weights)
+    with open(index_file, "w") as f:
+        json.dump({"key": key, "regions": regions}, f, indent=4)
+    return regions, weights
+
+# Function to calculate the area-weighted mean of every region for every entry along the
+# first axis of data (time or year, latitude, longitude) with one sparse matrix product
+def region_means(data, weights):
+    flat = np.asarray(data, dtype=np.float64).reshape(data.shape[0], -1)
+    totals = np.asarray(weights.sum(axis=1)).ravel()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (weights @ flat.T).T / totals
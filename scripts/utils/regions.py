@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from CONFIG import use_dask
+from utils.compute import chunk_along
+
+ARCTIC_CIRCLE = 66 + 34/60
+
+# Latitudes that belong to each region
+REGIONS = {
+    "globe": lambda lats: np.full(lats.shape, True),
+    "north": lambda lats: lats >= 0,
+    "south": lambda lats: lats < 0,
+    "arctic": lambda lats: lats >= ARCTIC_CIRCLE,
+    "antarctic": lambda lats: lats <= -ARCTIC_CIRCLE,
+}
+
+# Cache of the weight matrices, keyed by latitudes and regions
+_weights_cache = {}
+
+# Function to calculate the (latitude, region) matrix of cosine of latitude weights,
+# normalized so each region's weights sum to 1
+def region_weights(lats, regions=REGIONS):
+    key = (lats.tobytes(), tuple(regions))
+    if key not in _weights_cache:
+        masks = np.stack([regions[region](lats) for region in regions], axis=1)
+        weights = np.cos(np.deg2rad(lats))[:, None] * masks
+        _weights_cache[key] = weights / weights.sum(axis=0)
+    return _weights_cache[key]
+
+# Function to average the data over longitude, one year of months at a time
+def zonal_means(t2m):
+    if use_dask:
+        return chunk_along(t2m, "time").astype(np.float64).mean("longitude").values
+    return np.concatenate([
+        t2m.isel(time=slice(start, start + 12)).values.astype(np.float64).mean(axis=-1)
+        for start in tqdm(range(0, t2m.sizes["time"], 12), desc="Reading months")
+    ])
+
+# Function to calculate the weighted mean of every region in every month in one pass over
+# the data, returned as a DataFrame with a row per month and a column per region
+def monthly_region_means(t2m, regions=REGIONS):
+    weights = region_weights(t2m.latitude.values, regions)
+    means = zonal_means(t2m) @ weights
+    times = pd.DatetimeIndex(t2m.time.values)
+    index = pd.MultiIndex.from_arrays([times.year, times.month], names=["year", "month"])
+    return pd.DataFrame(means, index=index, columns=list(regions))
+
+# Function to average the monthly region means into annual means. Years without a value in
+# every month, e.g. because their last months are still missing from expver 1, are NaN
+# rather than the mean of the months they have.
+def annual_region_means(monthly):
+    years = monthly.groupby(level="year")
+    return years.mean().where(years.count() == 12)
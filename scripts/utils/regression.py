@@ -0,0 +1,101 @@
+import numpy as np
+from scipy.stats import t as t_dist
+
+# The statistics returned for every series, named like scipy.stats.linregress
+STATS = ["slope", "intercept", "rvalue", "pvalue", "stderr", "intercept_stderr"]
+
+# Same guard scipy.stats.linregress uses to keep the t statistic finite when |r| == 1
+TINY = 1.0e-20
+
+# Function to fit the least squares line of x vs. every series in y at once.
+# x has one value per entry along the first axis of y; the remaining axes of y
+# (e.g. latitude and longitude) are treated as independent series. NaNs are masked
+# per series, and series with fewer than 2 valid points get NaN for every statistic.
+# Cells are processed in blocks of chunk_size to bound the size of the temporaries.
+def linregress_batch(x, y, chunk_size=65536):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y)
+    shape = y.shape[1:]
+    y = y.reshape(len(x), -1)
+
+    results = {stat: np.full(y.shape[1], np.nan) for stat in STATS}
+
+    for start in range(0, y.shape[1], chunk_size):
+        block = slice(start, start + chunk_size)
+        for stat, values in _linregress_block(x, y[:, block].astype(np.float64)).items():
+            results[stat][block] = values
+
+    return {stat: values.reshape(shape) for stat, values in results.items()}
+
+# Function to run the regression over one (n, cells) block
+def _linregress_block(x, y):
+    valid = ~np.isnan(y)
+    n = valid.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Means over the valid points of each series
+        x_mean = np.where(valid, x[:, None], 0).sum(axis=0) / n
+        y_mean = np.where(valid, y, 0).sum(axis=0) / n
+
+        # Average sums of square differences from the means, as in linregress
+        dx = np.where(valid, x[:, None] - x_mean, 0)
+        dy = np.where(valid, y - y_mean, 0)
+        ssxm = (dx * dx).sum(axis=0) / n
+        ssym = (dy * dy).sum(axis=0) / n
+        ssxym = (dx * dy).sum(axis=0) / n
+
+    return _line_stats(n, x_mean, y_mean, ssxm, ssym, ssxym)
+
+# Function to fit the same lines from per-series running sums of x, y, xy, x² and y², so a
+# fit can be extended with new points without revisiting the old ones. x_offset is the
+# value that was subtracted from every x before summing; keeping x small that way avoids
+# losing precision to cancellation in the sums of squares.
+def linregress_from_sums(n, sx, sy, sxy, sxx, syy, x_offset=0.0):
+    n = np.asarray(n, dtype=np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = sx / n
+        y_mean = sy / n
+        ssxm = np.maximum(sxx / n - x_mean ** 2, 0.0)
+        ssym = np.maximum(syy / n - y_mean ** 2, 0.0)
+        ssxym = sxy / n - x_mean * y_mean
+
+    return _line_stats(n, x_mean + x_offset, y_mean, ssxm, ssym, ssxym)
+
+# Function to turn the means and average sums of square differences into the linregress
+# statistics, masking series with fewer than 2 points
+def _line_stats(n, x_mean, y_mean, ssxm, ssym, ssxym):
+    enough = n >= 2
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = ssxym / ssxm
+        intercept = y_mean - slope * x_mean
+
+        # R-value, with the same handling of flat series as linregress
+        r = np.clip(ssxym / np.sqrt(ssxm * ssym), -1.0, 1.0)
+        flat = (ssxm == 0) | (ssym == 0)
+        r = np.where(flat, np.where(ssxym == 0, np.nan, 0.0), r)
+
+        # Two-sided p-value and standard errors from n - 2 degrees of freedom
+        df = n - 2
+        t = r * np.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+        pvalue = 2 * t_dist.sf(np.abs(t), np.maximum(df, 1))
+        stderr = np.sqrt((1 - r ** 2) * ssym / ssxm / df)
+        intercept_stderr = stderr * np.sqrt(ssxm + x_mean ** 2)
+
+    # With exactly two points the line is exact, so follow linregress's special case
+    # (two points have no spread in y exactly when they are equal)
+    two = n == 2
+    pvalue = np.where(two, np.where(ssym == 0, 1.0, 0.0), pvalue)
+    stderr = np.where(two, 0.0, stderr)
+    intercept_stderr = np.where(two, 0.0, intercept_stderr)
+
+    results = {
+        "slope": slope,
+        "intercept": intercept,
+        "rvalue": r,
+        "pvalue": pvalue,
+        "stderr": stderr,
+        "intercept_stderr": intercept_stderr,
+    }
+    return {stat: np.where(enough, values, np.nan) for stat, values in results.items()}
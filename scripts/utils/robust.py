@@ -0,0 +1,91 @@
+import numpy as np
+from scipy.stats import norm
+
+# The robust trend statistics returned for every series
+ROBUST_STATS = ["sen_slope", "sen_intercept", "mk_tau", "mk_z", "mk_pvalue"]
+
+# Most bytes of pairwise differences held at a time
+MAX_BYTES = 2 ** 28
+
+# Function to compute the Theil–Sen slope and intercept and the Mann–Kendall trend test of x
+# vs. every series in y at once, in the layout of linregress_batch: the first axis of y has one
+# value per x, and the remaining axes are independent series. NaNs are masked per series.
+#
+# sen_slope is the median slope over every pair of points, and sen_intercept is
+# median(y) - sen_slope * median(x), as in scipy.stats.theilslopes. mk_tau is Kendall's
+# tau-a of the series against x, and mk_z and mk_pvalue are the continuity-corrected normal
+# approximation of the Mann–Kendall S statistic, with the variance corrected for tied
+# values. The slope needs at least 2 valid points and the test at least 3.
+#
+# Both need every pair of points in a series, so cells are processed in blocks sized to keep
+# the pairwise differences within MAX_BYTES.
+def robust_trends_batch(x, y, max_bytes=MAX_BYTES):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y)
+    shape = y.shape[1:]
+    y = y.reshape(len(x), -1)
+
+    # Order the points by x so that every pair (i, j) with i < j goes forward in x
+    order = np.argsort(x, kind="stable")
+    x = x[order]
+    y = y[order]
+
+    first, second = np.triu_indices(len(x), k=1)
+    chunk_size = max(1, max_bytes // (max(len(first), 1) * 8 * 3))
+
+    results = {stat: np.full(y.shape[1], np.nan) for stat in ROBUST_STATS}
+    for start in range(0, y.shape[1], chunk_size):
+        block = slice(start, start + chunk_size)
+        for stat, values in _robust_block(x, y[:, block].astype(np.float64), first, second).items():
+            results[stat][block] = values
+
+    return {stat: values.reshape(shape) for stat, values in results.items()}
+
+# Function to take the median along the first axis, ignoring NaNs, for every column at once.
+# NaNs sort to the end, so the median of each column is in the middle of its valid values.
+def _nan_median(values, counts):
+    ordered = np.sort(values, axis=0)
+    low = np.clip((counts - 1) // 2, 0, None)
+    high = np.clip(counts // 2, 0, None)
+    with np.errstate(invalid="ignore"):
+        return (
+            np.take_along_axis(ordered, low[None], axis=0)[0]
+            + np.take_along_axis(ordered, high[None], axis=0)[0]
+        ) / 2
+
+# Function to compute the robust statistics over one (n, cells) block
+def _robust_block(x, y, first, second):
+    valid = ~np.isnan(y)
+    n = valid.sum(axis=0)
+
+    # Slopes and signs of every pair of points, NaN where either point is missing
+    dy = y[second] - y[first]
+    dx = (x[second] - x[first])[:, None]
+    n_pairs = np.count_nonzero(~np.isnan(dy), axis=0)
+
+    # Theil–Sen slope and intercept
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = _nan_median(dy / dx, n_pairs)
+    x_median = _nan_median(np.where(valid, x[:, None], np.nan), n)
+    intercept = _nan_median(y, n) - slope * x_median
+
+    # Mann–Kendall S, and its variance less the correction for each group of t tied values:
+    # the sum over groups of t(t - 1)(2t + 5), taken here over values as (t - 1)(2t + 5)
+    s = np.nansum(np.sign(dy), axis=0)
+    ties = (y[:, None] == y[None, :]).sum(axis=1)
+    tie_term = np.where(valid, (ties - 1) * (2 * ties + 5), 0).sum(axis=0)
+    variance = (n * (n - 1) * (2 * n + 5) - tie_term) / 18
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(s == 0, 0.0, (s - np.sign(s)) / np.sqrt(variance))
+        tau = s / (n * (n - 1) / 2)
+    pvalue = 2 * norm.sf(np.abs(z))
+
+    enough = n >= 3
+    return {
+        "sen_slope": np.where(n >= 2, slope, np.nan),
+        "sen_intercept": np.where(n >= 2, intercept, np.nan),
+        "mk_tau": np.where(enough, tau, np.nan),
+        "mk_z": np.where(enough & (variance > 0), z, np.nan),
+        "mk_pvalue": np.where(enough & (variance > 0), pvalue, np.nan),
+    }
@@ -0,0 +1,207 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+from CONFIG import seasons, cube_layout, cube_chunk
+
+# Define the directory for the seasonal outputs
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+output_dir = os.path.join(dirname, "data", "output")
+year_dir = os.path.join(output_dir, "year")
+
+HEMISPHERES = ["north", "south"]
+
+# Most per-year files opened at once
+OPEN_THREADS = 16
+
+# Function to check the season definitions from CONFIG and spell them out as the months of
+# each season in each hemisphere, and whether a season that crosses the new year belongs to
+# the year it starts or ends in
+def normalize_seasons(seasons):
+    normalized = {}
+    for season, definition in seasons.items():
+        if "months" in definition:
+            months = {hemisphere: definition["months"] for hemisphere in HEMISPHERES}
+        else:
+            months = {hemisphere: definition[hemisphere] for hemisphere in HEMISPHERES}
+        year = definition.get("year", "end")
+        if year not in ("start", "end"):
+            raise ValueError(f"Season {season}: year must be \"start\" or \"end\", not {year!r}")
+
+        for hemisphere, season_months in months.items():
+            if not season_months or len(set(season_months)) != len(season_months) or not all(1 <= month <= 12 for month in season_months):
+                raise ValueError(f"Season {season}: the {hemisphere} months must be distinct months from 1 to 12")
+            if sum(later < earlier for earlier, later in zip(season_months, season_months[1:])) > 1:
+                raise ValueError(f"Season {season}: the {hemisphere} months can only cross the new year once")
+
+        normalized[season] = {**{hemisphere: list(months[hemisphere]) for hemisphere in HEMISPHERES}, "year": year}
+    return normalized
+
+SEASONS = normalize_seasons(seasons)
+
+# Function to find the offset from the calendar year of each month of a season to the season's
+# year. If the season crosses the new year and is counted in the year it ends in, the months
+# before the new year are +1; if it is counted in the year it starts in, the months after are -1.
+def month_offsets(months, year="end"):
+    wrap = next((i for i in range(1, len(months)) if months[i] < months[i - 1]), None)
+    if wrap is None:
+        return [0] * len(months)
+    if year == "end":
+        return [1 if i < wrap else 0 for i in range(len(months))]
+    return [0 if i < wrap else -1 for i in range(len(months))]
+
+# Function to find the first day of the last month of a season in a hemisphere in a season year,
+# i.e. when the season is complete once that month is in
+def season_end(season, hemisphere, year, seasons=SEASONS):
+    months = seasons[season][hemisphere]
+    last_year = year - month_offsets(months, seasons[season]["year"])[-1]
+    return np.datetime64(f"{last_year}-{months[-1]:02d}-01", "ns")
+
+# Type the seasonal temperatures are stored as in the cube_layout
+cube_dtype = np.float32 if cube_layout == "timeseries" else np.float64
+
+# Function to build the NetCDF encoding of seasonal temperatures for the cube_layout: for
+# "timeseries", compressed float32 in chunks of every year for cube_chunk x cube_chunk cells,
+# and for "maps", contiguous float64
+def cube_encoding(ds):
+    if cube_layout == "maps":
+        return {name: {"dtype": "float64", "zlib": False, "shuffle": False, "contiguous": True} for name in ds.data_vars}
+    chunks = {"year": ds.sizes.get("year"), "latitude": cube_chunk, "longitude": cube_chunk}
+    return {
+        name: {
+            "dtype": "float32",
+            "zlib": True,
+            "complevel": 4,
+            "shuffle": True,
+            "chunksizes": tuple(min(chunks[dim], ds.sizes[dim]) for dim in ds[name].dims),
+        }
+        for name in ds.data_vars
+    }
+
+# Function to convert Kelvin to Fahrenheit
+def kelvin_to_fahrenheit(kelvin):
+    return (kelvin - 273.15) * 9/5 + 32
+
+# Function to build the season x hemisphere x month lookup tables: whether each month
+# belongs to the season, and the offset from its calendar year to the season's year
+def season_lookup(seasons=SEASONS):
+    member = np.zeros((len(seasons), len(HEMISPHERES), 12), dtype=bool)
+    offset = np.zeros((len(seasons), len(HEMISPHERES), 12), dtype=int)
+    for s, season in enumerate(seasons):
+        for h, hemisphere in enumerate(HEMISPHERES):
+            months = seasons[season][hemisphere]
+            for month, month_offset in zip(months, month_offsets(months, seasons[season]["year"])):
+                member[s, h, month - 1] = True
+                offset[s, h, month - 1] = month_offset
+    return member, offset
+
+# Function to build the season x hemisphere x month weights of each calendar month in the
+# value of a season. A season takes the value of its latest month in calendar order, as the
+# per-month loop of the original annual-seasons.py left it, e.g. August for June-August and
+# December for December-February.
+def month_weights(seasons=SEASONS):
+    member, _ = season_lookup(seasons)
+    latest = 11 - np.argmax(member[..., ::-1], axis=-1)
+    return (np.arange(12) == latest[..., None]).astype(np.float64)
+
+# Function to build, for each hemisphere, the (season, year, time) matrix that picks the
+# month of the time axis that gives each season of each year its value: the latest of the
+# season's months in calendar order that is on the time axis. Seasons with none of their
+# months on the time axis get an all-zero row.
+def season_weights(times, years, seasons=SEASONS):
+    times = pd.DatetimeIndex(times)
+    months = times.month.values - 1
+    member, offset = season_lookup(seasons)
+    years = np.asarray(years)
+
+    weights = np.zeros((len(HEMISPHERES), len(seasons), len(years), len(times)))
+    for h in range(len(HEMISPHERES)):
+        year_index = times.year.values[None, :] + offset[:, h, months] - years[0]
+        inside = member[:, h, months] & (year_index >= 0) & (year_index < len(years))
+        s_index, t_index = np.nonzero(inside)
+        y_index = year_index[s_index, t_index]
+
+        # Only keep the latest calendar month of each season and year
+        latest = np.full((len(seasons), len(years)), -1)
+        np.maximum.at(latest, (s_index, y_index), months[t_index])
+        keep = months[t_index] == latest[s_index, y_index]
+        weights[h, s_index[keep], y_index[keep], t_index[keep]] = 1
+    return weights
+
+# Function to compose monthly data (time, latitude, longitude) into seasons (season, year,
+# latitude, longitude) with one matrix product per hemisphere. Cells whose month is NaN or
+# missing from the time axis are NaN.
+def compose_seasons(data, times, lats, years, seasons=SEASONS):
+    weights = season_weights(times, years, seasons)
+    n_time = data.shape[0]
+    result = np.full((len(seasons), len(years)) + data.shape[1:], np.nan)
+
+    for h, rows in enumerate([lats >= 0, lats < 0]):
+        if not np.any(rows):
+            continue
+        block = data[:, rows].reshape(n_time, -1)
+        valid = ~np.isnan(block)
+        w = weights[h].reshape(-1, n_time)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = (w @ np.where(valid, block, 0)) / (w @ valid)
+        result[:, :, rows] = values.reshape((len(seasons), len(years), np.count_nonzero(rows)) + data.shape[2:])
+    return result
+
+# Stacks one variable of the per-year files along a new first axis of years without reading
+# it: indexing the stack only reads the requested slice from the files of the requested years
+class YearStack(BackendArray):
+    def __init__(self, variables):
+        self.variables = variables
+        self.shape = (len(variables),) + variables[0].shape
+        self.dtype = variables[0].dtype
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.OUTER, self._getitem)
+
+    # Function to read an outer index of integers, slices and integer arrays
+    def _getitem(self, key):
+        year_key, rest = key[0], key[1:]
+        if isinstance(year_key, (int, np.integer)):
+            return self.variables[year_key][rest].values
+        indexes = np.arange(len(self.variables))[year_key]
+        if len(indexes) == 0:
+            return np.empty((0,) + self.variables[0][rest].shape, dtype=self.dtype)
+        return np.stack([self.variables[i][rest].values for i in indexes])
+
+# Function to stack datasets of (latitude, longitude) seasons, one per year, into one lazy
+# (year, latitude, longitude) dataset
+def stack_years(datasets, years):
+    first = datasets[0]
+    data_vars = {
+        name: xr.Variable(
+            ("year",) + first[name].dims,
+            indexing.LazilyIndexedArray(YearStack([ds[name].variable for ds in datasets]))
+        )
+        for name in first.data_vars
+    }
+    return xr.Dataset(data_vars, coords={"year": list(years), "latitude": first.latitude.values, "longitude": first.longitude.values})
+
+# Function to open the stacked (year, latitude, longitude) seasonal cube written by
+# annual-seasons.py, falling back to the per-year files if there is no cube. The year files
+# are opened concurrently and stacked lazily, so only the slices that are used are read.
+def open_seasonal_cube(start_year, end_year):
+    cube_file = os.path.join(output_dir, f"seasonal_temps_{start_year}_{end_year}.nc")
+    if os.path.exists(cube_file):
+        return xr.open_dataset(cube_file, engine="netcdf4")
+
+    year_files = {year: os.path.join(year_dir, f"seasonal_temps_{year}.nc") for year in range(start_year, end_year + 1)}
+    missing = [year for year, year_file in year_files.items() if not os.path.exists(year_file)]
+    if missing:
+        print(f"No seasonal temperatures for {len(missing)} of the years {start_year}-{end_year}, skipping: {', '.join(map(str, missing))}")
+
+    years = [year for year in year_files if year not in missing]
+    if not years:
+        return None
+
+    with ThreadPoolExecutor(OPEN_THREADS) as pool:
+        datasets = list(pool.map(lambda year: xr.open_dataset(year_files[year], engine="netcdf4"), years))
+    return stack_years(datasets, years)
@@ -0,0 +1,88 @@
+import os
+import json
+import xarray as xr
+
+from CONFIG import engine, file_name, store_file_name, store_chunks
+
+# Define the input file and store paths
+dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+input_path = os.path.join(dirname, "data", "input", file_name)
+store_path = os.path.join(dirname, "data", "input", store_file_name)
+
+# Function to open a file downloaded from Copernicus with the same layout as the store:
+# expver 1 only, longitudes in the range -180 to 180 and float32 t2m
+def open_raw(path, chunks=None):
+    ds = xr.open_dataset(path, engine=engine, chunks=chunks)
+
+    # Filter the dataset for expver = 1
+    if engine == "netcdf4":
+        ds = ds.sel(expver=1)
+
+    # Adjust longitudes to be in the range -180 to 180
+    ds = ds.assign_coords(longitude=(((ds.longitude + 180) % 360) - 180)).sortby("longitude")
+
+    ds = ds[["t2m"]]
+    ds["t2m"] = ds["t2m"].astype("float32")
+    return ds
+
+# Function to build the NetCDF encoding of a (time, latitude, longitude) variable in the
+# layout of the store: chunked, compressed float32
+def store_encoding(da):
+    chunksizes = tuple(min(store_chunks[dim], da.sizes[dim]) for dim in da.dims)
+    return {"dtype": "float32", "zlib": True, "complevel": 4, "shuffle": True, "chunksizes": chunksizes}
+
+# Attributes recording the settings a store was built with, so open_input can tell when
+# CONFIG.py has changed since. NetCDF attributes can't hold dicts, so store_chunks is saved
+# as JSON.
+def store_attrs():
+    return {"engine": engine, "store_chunks": json.dumps(store_chunks, sort_keys=True)}
+
+# Function to decode the input file once into a chunked, compressed float32 NetCDF store.
+# The store is written in time blocks, so the whole input never has to fit in memory, and
+# it is only moved into place once it is complete.
+def ingest(input_path=input_path, store_path=store_path):
+    print(f"Ingesting {os.path.basename(input_path)} into {os.path.basename(store_path)}")
+
+    # Open the gridded file from Copernicus using xarray, one block of months at a time
+    ds = open_raw(input_path, chunks={"time": store_chunks["time"]})
+    encoding = {"t2m": store_encoding(ds["t2m"])}
+    ds.attrs = {**ds.attrs, **store_attrs()}
+
+    temp_path = f"{store_path}.tmp"
+    ds.to_netcdf(temp_path, engine="netcdf4", encoding=encoding)
+    os.replace(temp_path, store_path)
+    print(f"Saved data/input/{os.path.basename(store_path)}")
+    return ds["t2m"].size
+
+# Function to describe the ERA5 store and grid that cached results are computed from, so
+# they are only reused while the input is unchanged
+def input_fingerprint(ds, path=store_path):
+    return {
+        "file": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "mtime": os.path.getmtime(path),
+        "shape": [ds.sizes["latitude"], ds.sizes["longitude"]],
+        "latitude": [float(ds.latitude[0]), float(ds.latitude[-1])],
+        "longitude": [float(ds.longitude[0]), float(ds.longitude[-1])],
+    }
+
+# Function to open the ERA5 data lazily from the store, building the store first if it is
+# missing, older than the input file, or was built with a different engine or store_chunks
+def open_input():
+    if not os.path.exists(store_path) or (
+        os.path.exists(input_path) and os.path.getmtime(input_path) > os.path.getmtime(store_path)
+    ):
+        ingest()
+        return xr.open_dataset(store_path, engine="netcdf4")
+
+    ds = xr.open_dataset(store_path, engine="netcdf4")
+    built_with = {name: ds.attrs.get(name) for name in store_attrs()}
+    if built_with != store_attrs():
+        if not os.path.exists(input_path):
+            print(f"{os.path.basename(store_path)} was built with {built_with}, not {store_attrs()}, but {os.path.basename(input_path)} is missing, so it is used as is")
+            return ds
+        print(f"{os.path.basename(store_path)} was built with {built_with}, rebuilding it with {store_attrs()}")
+        ds.close()
+        ingest()
+        ds = xr.open_dataset(store_path, engine="netcdf4")
+    return ds
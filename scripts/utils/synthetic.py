@@ -0,0 +1,125 @@
+import json
+import numpy as np
+import pandas as pd
+import dask.array as da
+from dask import delayed
+import xarray as xr
+
+# Months of synthetic data generated at a time, so any resolution and span can be written
+BLOCK_MONTHS = 12
+
+# Months at the end of the record that only have preliminary (ERA5T, expver 5) data, as in
+# NetCDF downloads that include the most recent months
+PRELIMINARY_MONTHS = 3
+
+# Function to build the ERA5 grid at a resolution in degrees: latitudes from 90 down to -90
+# and longitudes from 0 up to 360, as they come from Copernicus
+def synthetic_grid(resolution):
+    lats = np.linspace(90, -90, int(round(180 / resolution)) + 1)
+    lons = np.arange(int(round(360 / resolution))) * resolution
+    return lats, lons
+
+# Function to fill one block of months with a plausible 2m temperature in Kelvin: warmer at
+# the equator, a seasonal cycle that is opposite in each hemisphere and larger towards the
+# poles, a warming trend that is faster at high latitudes, and noise. Every block has its
+# own seed, so the data doesn't depend on how it is split into blocks.
+def _temperature_block(times, lats, lons, seed):
+    times = pd.DatetimeIndex(times)
+    rng = np.random.default_rng([seed, int(times[0].year), int(times[0].month)])
+    lat_rad = np.deg2rad(lats)[None, :, None]
+    lon_rad = np.deg2rad(lons)[None, None, :]
+    phase = 2 * np.pi * (times.month.values - 1.5) / 12
+    years = (times.year.values + (times.month.values - 1) / 12 - 1940)[:, None, None]
+
+    t2m = (
+        300 - 50 * np.sin(lat_rad) ** 2
+        - np.sign(lat_rad) * (2 + 18 * np.abs(np.sin(lat_rad))) * np.cos(phase)[:, None, None]
+        + 3 * np.sin(3 * lon_rad) * np.cos(lat_rad)
+        + (0.01 + 0.03 * np.abs(np.sin(lat_rad))) * years
+        + rng.normal(0, 1, (len(times), len(lats), len(lons)))
+    )
+    return t2m.astype(np.float32)
+
+# Function to build a lazy dataset of synthetic monthly t2m from January of start_year to
+# December of end_year, laid out like the ERA5 download for the engine: for netcdf4 with an
+# expver dimension where the last months are only in expver 5, and for cfgrib with the
+# scalar coordinates cfgrib adds
+def synthetic_dataset(start_year, end_year, resolution=1.0, engine="netcdf4", seed=0):
+    lats, lons = synthetic_grid(resolution)
+    times = pd.date_range(f"{start_year}-01-01", f"{end_year}-12-01", freq="MS")
+
+    blocks = [
+        da.from_delayed(
+            delayed(_temperature_block)(times[start:start + BLOCK_MONTHS].values, lats, lons, seed),
+            shape=(len(times[start:start + BLOCK_MONTHS]), len(lats), len(lons)),
+            dtype=np.float32
+        )
+        for start in range(0, len(times), BLOCK_MONTHS)
+    ]
+    t2m = da.concatenate(blocks, axis=0)
+
+    attrs = {"units": "K", "long_name": "2 metre temperature"}
+    coords = {"time": times, "latitude": lats, "longitude": lons}
+    if engine == "netcdf4":
+        preliminary = np.arange(len(times)) >= len(times) - PRELIMINARY_MONTHS
+        final = da.where(preliminary[:, None, None], np.float32(np.nan), t2m)
+        early = da.where(preliminary[:, None, None], t2m, np.float32(np.nan))
+        data = da.stack([final, early], axis=1)
+        return xr.Dataset(
+            {"t2m": (["time", "expver", "latitude", "longitude"], data, attrs)},
+            coords={**coords, "expver": [1, 5]}
+        )
+
+    ds = xr.Dataset({"t2m": (["time", "latitude", "longitude"], t2m, attrs)}, coords=coords)
+    return ds.assign_coords(number=0, step=np.timedelta64(0, "ns"), surface=0.0, valid_time=("time", times))
+
+# Function to write the synthetic dataset where the scripts expect the ERA5 download
+def write_synthetic(path, start_year, end_year, resolution=1.0, engine="netcdf4", seed=0):
+    ds = synthetic_dataset(start_year, end_year, resolution, engine, seed)
+    if engine == "netcdf4":
+        ds.to_netcdf(path, engine="netcdf4", encoding={"t2m": {"dtype": "float32"}})
+    else:
+        _write_grib(ds, path)
+    return ds
+
+# Function to write the data as GRIB 1 messages of 2m temperature, one per month, with
+# ecCodes, so the file goes through the same cfgrib decoding as the real download
+def _write_grib(ds, path):
+    import eccodes
+
+    lats = ds.latitude.values
+    lons = ds.longitude.values
+    resolution = float(lons[1] - lons[0])
+    with open(path, "wb") as f:
+        for start in range(0, ds.sizes["time"], BLOCK_MONTHS):
+            block = ds["t2m"].isel(time=slice(start, start + BLOCK_MONTHS))
+            for time, values in zip(pd.DatetimeIndex(block.time.values), block.values):
+                gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib1")
+                eccodes.codes_set_key_vals(gid, {
+                    "paramId": 167,
+                    "Ni": len(lons),
+                    "Nj": len(lats),
+                    "latitudeOfFirstGridPointInDegrees": float(lats[0]),
+                    "latitudeOfLastGridPointInDegrees": float(lats[-1]),
+                    "longitudeOfFirstGridPointInDegrees": float(lons[0]),
+                    "longitudeOfLastGridPointInDegrees": float(lons[-1]),
+                    "iDirectionIncrementInDegrees": resolution,
+                    "jDirectionIncrementInDegrees": resolution,
+                    "dataDate": int(time.strftime("%Y%m%d")),
+                    "dataTime": 0,
+                })
+                eccodes.codes_set_values(gid, values.astype(np.float64).ravel())
+                eccodes.codes_write(gid, f)
+                eccodes.codes_release(gid)
+
+# Function to write n random cities, spread evenly over the sphere, in the cities.json format
+def write_synthetic_cities(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = np.rad2deg(np.arcsin(rng.uniform(-1, 1, n)))
+    lons = rng.uniform(-180, 180, n)
+    cities = [
+        {"id": str(i + 1), "name": f"City {i + 1}", "lat": round(float(lat), 4), "lon": round(float(lon), 4)}
+        for i, (lat, lon) in enumerate(zip(lats, lons))
+    ]
+    with open(path, "w") as f:
+        json.dump(cities, f)
@@ -0,0 +1,110 @@
+import os
+import netCDF4 as nc
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from tqdm import tqdm
+
+from utils.compute import num_workers
+
+# Tiles read ahead of the ones being written, per worker
+TILES_PER_WORKER = 2
+
+# A rectangle of grid cells processed at once. rows and cols are the cells the tile produces,
+# and read_rows and read_cols the cells read for it, which also include a halo of neighbouring
+# cells for calculations that need them.
+class Tile:
+    def __init__(self, rows, cols, read_rows, read_cols):
+        self.rows = rows
+        self.cols = cols
+        self.read_rows = read_rows
+        self.read_cols = read_cols
+
+    # Name of the tile, e.g. for checkpoints
+    def __str__(self):
+        return f"rows {self.rows.start}-{self.rows.stop} cols {self.cols.start}-{self.cols.stop}"
+
+    # Function to cut the halo off an array read for the tile, whose last two axes are latitude and longitude
+    def trim(self, array):
+        row_start = self.rows.start - self.read_rows.start
+        col_start = self.cols.start - self.read_cols.start
+        return array[..., row_start:row_start + self.rows.stop - self.rows.start, col_start:col_start + self.cols.stop - self.cols.start]
+
+# Function to split a grid of n_lats x n_lons cells into tiles of at most size x size cells,
+# each read with a halo of up to `halo` cells on every side, clipped to the grid
+def grid_tiles(n_lats, n_lons, size, halo=0):
+    tiles = []
+    for row in range(0, n_lats, size):
+        for col in range(0, n_lons, size):
+            rows = slice(row, min(row + size, n_lats))
+            cols = slice(col, min(col + size, n_lons))
+            read_rows = slice(max(row - halo, 0), min(rows.stop + halo, n_lats))
+            read_cols = slice(max(col - halo, 0), min(cols.stop + halo, n_lons))
+            tiles.append(Tile(rows, cols, read_rows, read_cols))
+    return tiles
+
+# Function to run compute(tile, data) for every tile on a pool of `workers` threads, where
+# read(tile) reads the tile's input and write(tile, result) stores its output. Reading and
+# writing stay in this thread, so only one thread uses the NetCDF library, and only a few
+# tiles per worker are held at once, so the memory used scales with the tile size rather
+# than with the grid. restore(tile) can return the result of a tile from an earlier run, or
+# None to compute it.
+def map_tiles(tiles, read, compute, write, restore=None, desc="Processing tiles"):
+    with ThreadPoolExecutor(num_workers) as pool, tqdm(total=len(tiles), desc=desc) as progress:
+        pending = {}
+
+        # Function to write the tiles that have finished, waiting for at least one if wait_for_one
+        def write_finished(wait_for_one):
+            done, _ = wait(pending, timeout=None if wait_for_one else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(pending.pop(future), future.result())
+                progress.update()
+
+        for tile in tiles:
+            result = restore(tile) if restore else None
+            if result is not None:
+                write(tile, result)
+                progress.update()
+                continue
+            pending[pool.submit(compute, tile, read(tile))] = tile
+            write_finished(len(pending) >= TILES_PER_WORKER * num_workers)
+
+        while pending:
+            write_finished(True)
+
+# A NetCDF file written a tile at a time, so the whole grid never has to be in memory. The file
+# is written to a temporary path and only moved into place by close(), once every tile is in.
+class TiledWriter:
+    # coords maps each dimension to its values, variables maps each variable to its dimensions,
+    # with latitude and longitude last, and encoding optionally gives each variable's dtype,
+    # zlib, complevel, shuffle, chunksizes or contiguous, as for xarray's to_netcdf
+    def __init__(self, path, coords, variables, encoding=None):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.dataset = nc.Dataset(self.temp_path, "w", format="NETCDF4")
+
+        for dim, values in coords.items():
+            values = np.asarray(values)
+            self.dataset.createDimension(dim, len(values))
+            self.dataset.createVariable(dim, values.dtype, (dim,))[:] = values
+
+        for name, dims in variables.items():
+            options = (encoding or {}).get(name, {})
+            dtype = np.dtype(options.get("dtype", "float64"))
+            self.dataset.createVariable(
+                name, dtype, dims,
+                zlib=options.get("zlib", False),
+                complevel=options.get("complevel", 4),
+                shuffle=options.get("shuffle", False),
+                chunksizes=options.get("chunksizes"),
+                contiguous=options.get("contiguous", False),
+                fill_value=np.nan if dtype.kind == "f" else None
+            )
+
+    # Function to write the values of a variable in a tile, with the tile's cells in the last two axes
+    def write(self, name, tile, values):
+        self.dataset[name][..., tile.rows, tile.cols] = values
+
+    # Function to finish the file and move it into place
+    def close(self):
+        self.dataset.close()
+        os.replace(self.temp_path, self.path)